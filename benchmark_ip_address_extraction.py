@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+
+# This script will measure the throughput of the IP address extraction function utils.iter_ip_addresses
+
+
+import io
+import sys
+import time
+
+import utils
+
+
+def build_sample_config(interface_count=48, svi_every=12):
+    """
+    This function will build a sample access switch configuration, with {interface_count} access ports, ACL entries,
+    and one interface with IPv4 (primary and secondary) and IPv6 addresses for every {svi_every} interfaces
+    :param interface_count: number of interfaces
+    :param svi_every: one interface with IP addresses for every {svi_every} interfaces
+    :return: string with the configuration
+    """
+    config_lines = ['version 16.9', 'hostname SW1', '!']
+    for index in range(interface_count):
+        config_lines += ['interface GigabitEthernet1/0/' + str(index),
+                         ' description access port for building ' + str(index),
+                         ' switchport access vlan 10',
+                         ' switchport mode access',
+                         ' spanning-tree portfast']
+        if index % svi_every == 0:
+            config_lines += [' ip address 10.' + str(index) + '.0.1 255.255.255.0',
+                             ' ip address 10.' + str(index) + '.1.1 255.255.255.0 secondary',
+                             ' ipv6 address 2001:DB8:' + str(index) + '::1/64']
+        config_lines.append('!')
+    config_lines.append('ip access-list extended ACL_IN')
+    for index in range(200):
+        config_lines.append(' permit tcp any host 10.1.1.' + str(index) + ' eq 443')
+    config_lines += ['!', 'line vty 0 4', ' transport input ssh', '!', 'end']
+    return '\n'.join(config_lines) + '\n'
+
+
+def main(size_mb=100):
+    """
+    This script will build {size_mb} MB of sample configurations, and measure the extraction throughput for a string
+    and for a file
+    :param size_mb: configuration size, in MB
+    """
+    sample_config = build_sample_config()
+    configuration = sample_config * (size_mb * 1048576 // len(sample_config))
+    config_mb = len(configuration) / 1048576
+
+    start_time = time.time()
+    address_count = sum(1 for address_info in utils.iter_ip_addresses(configuration))
+    duration = time.time() - start_time
+    print('String input: %.1f MB, %d addresses, %.2f seconds, %.1f MB/s' %
+          (config_mb, address_count, duration, config_mb / duration))
+
+    start_time = time.time()
+    address_count = sum(1 for address_info in utils.iter_ip_addresses(io.StringIO(configuration)))
+    duration = time.time() - start_time
+    print('File input:   %.1f MB, %d addresses, %.2f seconds, %.1f MB/s' %
+          (config_mb, address_count, duration, config_mb / duration))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(int(sys.argv[1]))
+    else:
+        main()
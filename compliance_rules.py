@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+
+# This file contains the configuration compliance rules, and the functions to evaluate the rules.
+# Each rule is declared as data:
+# - 'name': the policy name, reported as 'Passed <name>' when the rule passes
+# - 'pattern': regular expression, the rule fails if the pattern is found in the configuration changes
+# - 'sections': list of section types, the rule fails if a section with one of these types is added, removed or
+#   changed. The sections are looked up in the section index of the old and the new configuration trees
+# - 'check': name of a check function, provided by the caller, the rule fails if the function returns True
+# - 'fail_comment': the comment reported when the rule fails
+# All the pattern rules are compiled in one regular expression, and evaluated with one match call. Each rule has its own
+# lookahead, the rules with overlapping patterns are all evaluated.
+
+import re
+
+import config_parser
+
+
+COMPLIANCE_RULES = [
+    {'name': 'ACL Policy',
+     'sections': ['access-list', 'ip access-list', 'ipv6 access-list', 'mac access-list'],
+     'fail_comment': 'Validation against ACL changes failed'},
+    {'name': 'Logging Policy',
+     'sections': ['logging'],
+     'fail_comment': 'Validation against logging changes failed'},
+    {'name': 'Duplicate IPv4 Prevention',
+     'check': 'duplicate_ipv4',
+     'fail_comment': 'Validation against duplicated IPv4 addresses failed'},
+    {'name': 'Subnet Overlap Prevention',
+     'check': 'subnet_overlap',
+     'fail_comment': 'Validation against overlapping IPv4 subnets failed'}
+]
+
+
+def compile_rules(rules):
+    """
+    This function will compile all the pattern rules from the list {rules} in one regular expression, with one
+    optional lookahead and one named group for each rule. The lookahead searches the rule pattern anywhere in the
+    changes, the group is set if the pattern is found
+    :param rules: list of compliance rules
+    :return: compiled rules - {'rules': rules, 'matcher': compiled regular expression, or None if no pattern rules}
+    """
+    patterns = []
+    for rule_number, rule in enumerate(rules):
+        if 'pattern' in rule:
+            patterns.append('(?=(?s:.*?)(?P<rule_' + str(rule_number) + '>' + rule['pattern'] + '))?')
+    matcher = None
+    if patterns:
+        matcher = re.compile(''.join(patterns))
+    return {'rules': rules, 'matcher': matcher}
+
+
+COMPILED_RULES = compile_rules(COMPLIANCE_RULES)
+
+
+def evaluate_rules(changes, checks=None, compiled_rules=COMPILED_RULES, trees=None):
+    """
+    This function will evaluate all the compliance rules against the configuration changes {changes}.
+    The pattern rules are evaluated with one match call, each pattern rule is evaluated independently.
+    The section rules compare the sections from the configuration trees {trees}, with section index lookups.
+    The check rules call the function with the same name from {checks}, with the changes as argument.
+    :param changes: text with the configuration changes
+    :param checks: check functions - {check name: function}
+    :param compiled_rules: compiled rules, from the function {compile_rules}
+    :param trees: (old configuration tree, new configuration tree), from the config_parser module, required for the
+    section rules
+    :return: list of failed rules, list of passed rules
+    """
+    rules = compiled_rules['rules']
+    failed_rules = set()
+
+    # evaluate all the pattern rules, with one match
+    matcher = compiled_rules['matcher']
+    if matcher is not None:
+        for group_name, found in matcher.match(changes).groupdict().items():
+            if found is not None:
+                failed_rules.add(int(group_name.split('_')[1]))
+
+    # evaluate the section rules
+    for rule_number, rule in enumerate(rules):
+        if 'sections' in rule:
+            if trees is None:
+                raise ValueError('The configuration trees are required for the rule: ' + rule['name'])
+            for section_type in rule['sections']:
+                if config_parser.get_changed_sections(trees[0], trees[1], section_type):
+                    failed_rules.add(rule_number)
+                    break
+
+    # evaluate the check rules
+    for rule_number, rule in enumerate(rules):
+        if 'check' in rule and checks and rule['check'] in checks:
+            if checks[rule['check']](changes):
+                failed_rules.add(rule_number)
+
+    violations = []
+    passed = []
+    for rule_number, rule in enumerate(rules):
+        if rule_number in failed_rules:
+            violations.append(rule)
+        else:
+            passed.append(rule)
+    return violations, passed
@@ -13,6 +13,7 @@
 PUB_KEY = ''
 SUB_KEY = ''
 CHANNEL = ''
+REPLY_CHANNEL = CHANNEL + '_reply'  # the devices publish the command results on this channel
 
 # Update this section with the Webeex Teams token for each student
 WEBEX_TEAMS_URL = 'https://api.ciscospark.com/v1'
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+
+# This file contains the IOS configuration parser functions.
+# The running configuration is parsed in a tree, each command is a node with the children commands (the indented
+# commands under the parent command), and each top level command is indexed by section type and name:
+# 'interface GigabitEthernet1/0/1' - type 'interface', name 'GigabitEthernet1/0/1'
+# 'ip access-list extended ACL_IN' - type 'ip access-list', name 'ACL_IN'
+# 'access-list 10 permit any'      - type 'access-list', name '10'
+# 'router ospf 1'                  - type 'router', name 'ospf 1'
+# 'no logging console'             - type 'logging', name 'console'
+
+import functools
+
+import config_store
+
+
+SNAPSHOT_CACHE_SIZE = 256  # number of parsed configuration snapshots kept in memory
+
+# section types with more than one word, longest first. All other commands use the first word as the section type
+SECTION_TYPES = ['ip access-list standard', 'ip access-list extended', 'ip access-list', 'ipv6 access-list',
+                 'mac access-list extended', 'ip prefix-list', 'ip dhcp pool', 'ip vrf', 'vrf definition', 'ip route',
+                 'ipv6 route', 'ip domain name', 'ip name-server']
+
+# section types indexed under a shorter section type ('ip access-list extended' -> 'ip access-list')
+SECTION_TYPE_ALIASES = {'ip access-list standard': 'ip access-list', 'ip access-list extended': 'ip access-list',
+                        'mac access-list extended': 'mac access-list'}
+
+# configuration lines that are not commands
+IGNORED_LINES = ('!', 'Building configuration', 'Current configuration')
+
+# section types where the section name is only the first word after the type, the other words are part of the command
+SHORT_NAME_TYPES = ['access-list', 'ip prefix-list']
+
+
+def get_section_type(command):
+    """
+    This function will return the section type and the section name for the configuration command {command}.
+    The 'no' commands use the section type of the command without 'no'
+    :param command: configuration command, without indentation
+    :return: section type, section name
+    """
+    command = command.strip()
+    if command.startswith('no '):
+        command = command[3:].strip()
+    for section_type in SECTION_TYPES:
+        if command == section_type or command.startswith(section_type + ' '):
+            section_name = command[len(section_type):].strip()
+            section_type = SECTION_TYPE_ALIASES.get(section_type, section_type)
+            break
+    else:
+        words = command.split(' ', 1)
+        section_type = words[0]
+        section_name = words[1].strip() if len(words) > 1 else ''
+    if section_type in SHORT_NAME_TYPES:
+        section_name = section_name.split(' ', 1)[0]
+    return section_type, section_name
+
+
+def new_node(text, parent):
+    """
+    This function will create a new configuration tree node for the command {text}, child of the node {parent}
+    :param text: configuration command, without indentation
+    :param parent: parent node, or None for top level commands
+    :return: configuration tree node
+    """
+    node = {'text': text, 'parent': parent, 'children': []}
+    if parent is not None:
+        parent['children'].append(node)
+    return node
+
+
+def parse_config(configuration):
+    """
+    This function will parse the configuration {configuration} in a configuration tree. The tree includes all top
+    level commands, with the children commands, and the index of the top level commands by section type and name.
+    Banners are saved as one node, with the banner lines as children.
+    :param configuration: string with the configuration, or an iterable of configuration lines (a file, for example)
+    :return: configuration tree - {'children': top level nodes, 'index': {type: {name: [nodes]}}}
+    """
+    if isinstance(configuration, str):
+        configuration = configuration.splitlines()
+
+    tree = {'children': [], 'index': {}}
+    stack = []  # the indentation and the node for the current command and all the parent commands
+    banner_delimiter = None
+    for line in configuration:
+        line = line.rstrip('\r\n')
+
+        # banner lines are saved without parsing, until the line with the banner delimiter
+        if banner_delimiter is not None:
+            new_node(line, banner_node)
+            if banner_delimiter in line:
+                banner_delimiter = None
+            continue
+
+        command = line.strip()
+        if not command or command.startswith(IGNORED_LINES):
+            continue
+        indent = len(line) - len(line.lstrip(' '))
+        while stack and stack[-1][0] >= indent:
+            stack.pop()
+
+        if stack:
+            node = new_node(command, stack[-1][1])
+        else:
+            node = new_node(command, None)
+            tree['children'].append(node)
+            section_type, section_name = get_section_type(command)
+            tree['index'].setdefault(section_type, {}).setdefault(section_name, []).append(node)
+        stack.append((indent, node))
+
+        if command.startswith('banner '):
+            words = command.split(' ')
+            if len(words) > 2 and words[2]:
+                delimiter = words[2][:2] if words[2].startswith('^') else words[2][0]
+                if delimiter not in command[command.index(words[2]) + len(delimiter):]:
+                    banner_delimiter = delimiter
+                    banner_node = node
+    return tree
+
+
+@functools.lru_cache(maxsize=SNAPSHOT_CACHE_SIZE)
+def parse_snapshot(config_hash):
+    """
+    This function will parse the configuration saved in the snapshot store with the hash {config_hash}. The parsed
+    configurations are cached, the snapshots never change
+    :param config_hash: configuration hash
+    :return: configuration tree
+    """
+    return parse_config(config_store.get_snapshot(config_hash))
+
+
+def get_sections(tree, section_type):
+    """
+    This function will return all the top level commands with the section type {section_type}
+    :param tree: configuration tree
+    :param section_type: section type, 'interface' for example
+    :return: {section name: [nodes]}
+    """
+    return tree['index'].get(section_type, {})
+
+
+def get_section(tree, section_type, section_name):
+    """
+    This function will return the top level command with the section type {section_type} and the name {section_name}
+    :param tree: configuration tree
+    :param section_type: section type, 'interface' for example
+    :param section_name: section name, 'GigabitEthernet1/0/1' for example
+    :return: the configuration tree node, or None if not found
+    """
+    nodes = get_sections(tree, section_type).get(section_name)
+    if nodes:
+        return nodes[0]
+    return None
+
+
+def get_changed_sections(old_tree, new_tree, section_type):
+    """
+    This function will compare the sections with the section type {section_type} from the configuration trees
+    {old_tree} and {new_tree}, using the section index
+    :param old_tree: configuration tree, the baseline configuration for example
+    :param new_tree: configuration tree
+    :param section_type: section type, 'ip access-list' for example
+    :return: sorted list with the names of the sections added, removed or changed
+    """
+    old_sections = get_sections(old_tree, section_type)
+    new_sections = get_sections(new_tree, section_type)
+    changed_sections = []
+    for section_name in set(old_sections) | set(new_sections):
+        old_text = [get_section_text(node) for node in old_sections.get(section_name, [])]
+        new_text = [get_section_text(node) for node in new_sections.get(section_name, [])]
+        if old_text != new_text:
+            changed_sections.append(section_name)
+    return sorted(changed_sections)
+
+
+def get_children_commands(node, prefix=''):
+    """
+    This function will return the children commands for the node {node}, that start with {prefix}
+    :param node: configuration tree node
+    :param prefix: command prefix, 'ip address' for example
+    :return: list of commands
+    """
+    commands = []
+    for child in node['children']:
+        if child['text'].startswith(prefix):
+            commands.append(child['text'])
+    return commands
+
+
+def get_section_text(node, indent=0):
+    """
+    This function will return the configuration text for the node {node} and all the children commands
+    :param node: configuration tree node
+    :param indent: indentation for the node command
+    :return: configuration text
+    """
+    config_lines = [' ' * indent + node['text']]
+    for child in node['children']:
+        config_lines.append(get_section_text(child, indent + 1))
+    return '\n'.join(config_lines)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+
+# This file contains the configuration snapshot store functions.
+# The device configurations are saved in the {SNAPSHOT_DIR} folder, one file for each unique configuration, with the
+# file name equal to the hash of the normalized configuration. Each device has a baseline file, with the hash of the
+# current baseline configuration, and a marker file, with the change marker of the last configuration processed.
+
+import hashlib
+import os
+import os.path
+import tempfile
+
+
+SNAPSHOT_DIR = 'config_snapshots'
+
+# configuration lines that change without any configuration changes, not included in the configuration hash
+IGNORED_LINES = ('Building configuration', 'Current configuration', '! Last configuration change',
+                 '! NVRAM config last updated', 'ntp clock-period')
+
+
+def normalize_config(configuration):
+    """
+    This function will normalize the configuration {configuration}: remove the trailing spaces, the empty lines and
+    the lines that change without any configuration changes (time stamps, configuration size)
+    :param configuration: string with the configuration
+    :return: normalized configuration
+    """
+    config_lines = []
+    for line in configuration.splitlines():
+        line = line.rstrip()
+        if line and not line.startswith(IGNORED_LINES):
+            config_lines.append(line)
+    return '\n'.join(config_lines)
+
+
+def get_config_hash(configuration):
+    """
+    This function will return the hash of the normalized configuration {configuration}
+    :param configuration: string with the configuration
+    :return: configuration hash
+    """
+    return hashlib.sha256(normalize_config(configuration).encode('utf-8')).hexdigest()
+
+
+def write_file(filename, text):
+    """
+    This function will write the {text} to the file {filename}. The text is written to a temp file first, and the temp
+    file is renamed, the file will never include a partial text
+    :param filename: file path and filename
+    :param text: text to write
+    :return:
+    """
+    # each call uses its own temp file, the threads writing the same file at the same time will not share it
+    temp_fd, temp_filename = tempfile.mkstemp(dir=os.path.dirname(filename) or '.', suffix='.tmp')
+    try:
+        with os.fdopen(temp_fd, 'w') as f:
+            f.write(text)
+        os.replace(temp_filename, filename)
+    except Exception:
+        os.remove(temp_filename)
+        raise
+
+
+def get_snapshot_path(config_hash):
+    """
+    This function will return the file path and filename for the configuration snapshot with the hash {config_hash}
+    :param config_hash: configuration hash
+    :return: file path and filename
+    """
+    return os.path.join(SNAPSHOT_DIR, 'objects', config_hash + '.txt')
+
+
+def save_snapshot(configuration):
+    """
+    This function will save the configuration {configuration} to the snapshot store, if not already saved
+    :param configuration: string with the configuration
+    :return: configuration hash
+    """
+    config_hash = get_config_hash(configuration)
+    snapshot_path = get_snapshot_path(config_hash)
+    if not os.path.isfile(snapshot_path):
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        write_file(snapshot_path, configuration)
+    return config_hash
+
+
+def get_snapshot(config_hash):
+    """
+    This function will return the configuration saved with the hash {config_hash}
+    :param config_hash: configuration hash
+    :return: string with the configuration
+    """
+    with open(get_snapshot_path(config_hash), 'r') as f:
+        return f.read()
+
+
+def get_baseline_path(device):
+    """
+    This function will return the file path and filename for the baseline file for the device with the name {device}
+    :param device: device hostname
+    :return: file path and filename
+    """
+    return os.path.join(SNAPSHOT_DIR, str(device) + '.baseline')
+
+
+def get_baseline_hash(device):
+    """
+    This function will return the baseline configuration hash for the device with the name {device}.
+    A device configuration file saved by previous versions of the application, {device}_run_config.txt, is imported
+    as the device baseline
+    :param device: device hostname
+    :return: baseline configuration hash, or None if the device does not have a baseline configuration
+    """
+    baseline_path = get_baseline_path(device)
+    if os.path.isfile(baseline_path):
+        with open(baseline_path, 'r') as f:
+            return f.read().strip()
+    legacy_filename = str(device) + '_run_config.txt'
+    if os.path.isfile(legacy_filename):
+        with open(legacy_filename, 'r') as f:
+            return set_baseline(device, f.read())
+    return None
+
+
+def set_baseline_hash(device, config_hash):
+    """
+    This function will set the snapshot with the hash {config_hash} as the baseline for the device with the name
+    {device}
+    :param device: device hostname
+    :param config_hash: configuration hash
+    :return:
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    write_file(get_baseline_path(device), config_hash + '\n')
+
+
+def set_baseline(device, configuration):
+    """
+    This function will save the configuration {configuration} and set it as the baseline for the device with the name
+    {device}
+    :param device: device hostname
+    :param configuration: string with the configuration
+    :return: configuration hash
+    """
+    config_hash = save_snapshot(configuration)
+    set_baseline_hash(device, config_hash)
+    return config_hash
+
+
+def get_marker_path(device):
+    """
+    This function will return the file path and filename for the change marker file for the device with the name
+    {device}
+    :param device: device hostname
+    :return: file path and filename
+    """
+    return os.path.join(SNAPSHOT_DIR, str(device) + '.marker')
+
+
+def get_device_marker(device):
+    """
+    This function will return the change marker saved for the device with the name {device}, the marker of the last
+    configuration processed for the device
+    :param device: device hostname
+    :return: change marker, or None if not saved
+    """
+    marker_path = get_marker_path(device)
+    if os.path.isfile(marker_path):
+        with open(marker_path, 'r') as f:
+            return f.read().strip()
+    return None
+
+
+def set_device_marker(device, marker):
+    """
+    This function will save the change marker {marker} for the device with the name {device}
+    :param device: device hostname
+    :param marker: change marker, the 'Last configuration change' line, for example
+    :return:
+    """
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    write_file(get_marker_path(device), marker + '\n')
@@ -9,11 +9,19 @@ import utils
 import dnac_apis
 import service_now_apis
 import pubnub_apis
+import config_store
+import config_parser
+import compliance_rules
 import os
 import os.path
 import difflib
 import datetime
 import time
+import heapq
+import random
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
 
 import requests
 import urllib3
@@ -27,6 +35,105 @@ urllib3.disable_warnings(InsecureRequestWarning)  # disable insecure https warni
 
 DNAC_AUTH = HTTPBasicAuth(DNAC_USER, DNAC_PASS)
 
+MAX_WORKERS = 16  # maximum number of devices processed in parallel
+
+# daemon mode, the polling interval for each device role, in seconds
+POLL_INTERVALS = {'CORE': 300, 'BORDER ROUTER': 300, 'DISTRIBUTION': 600, 'ACCESS': 1800}
+DEFAULT_POLL_INTERVAL = 900  # seconds, for the devices with other roles
+POLL_JITTER = 0.1  # each polling interval is randomly changed by up to 10%, to spread the DNA C API calls
+DAEMON_TICK = 60  # seconds, maximum scheduler sleep time, the device list is refreshed at least this often
+
+DNAC_TOKEN_TTL = 1800  # seconds, the DNA C token is valid for 60 minutes, a new token is requested every 30 minutes
+
+# the change marker, the running configuration is collected only if the last configuration change line changed
+CHANGE_MARKER_COMMAND = 'show running-config | include Last configuration change'
+CHANGE_MARKER_TEXT = '! Last configuration change'  # the marker line prefix, the command echo is not a marker
+
+
+def is_changed_line(line):
+    """
+    This function will check if the unified diff line {line} is a configuration change. The diff headers, the '!'
+    lines and the lines that change without any configuration changes are not configuration changes
+    :param line: unified diff line
+    :return: True/False
+    """
+    if 'Current configuration' in line or 'Last configuration change' in line:
+        return False
+    if '+++' in line or '---' in line or '-!' in line or '+!' in line:
+        return False
+    return line.startswith(('+', '-'))
+
+
+def compare_config_sections(old_cfg, new_cfg):
+    """
+    This function, using the unified diff function, will compare two configurations and identify the changes.
+    The diff output is split in sections, between the '!' characters, and each changed line is mapped to the sections
+    that include it, using an index of the section lines. Each line is processed once.
+    :param old_cfg: list with the old configuration lines
+    :param new_cfg: list with the new configuration lines
+    :return: text with the configuration sections that include changes, same as {compare_configs}, and a list with
+    the changed sections - [{'section': section header, 'added': added lines, 'removed': removed lines}]
+    """
+
+    # compare the two configurations, and select the lines that changed
+    # the last line could be without the new line character, all lines need one for the diff output to be split in lines
+    old_cfg = [line if line.endswith('\n') else line + '\n' for line in old_cfg]
+    new_cfg = [line if line.endswith('\n') else line + '\n' for line in new_cfg]
+    diff_lines = list(difflib.unified_diff(old_cfg, new_cfg, n=9))
+    changed_lines = []
+    for line in diff_lines:
+        if is_changed_line(line):
+            changed_lines.append(line.rstrip('\n'))
+
+    # split the diff output in sections between '!' characters, replace the empty '+' or '-' lines with '!'
+    diff_output = ''.join(diff_lines).replace('+!', '!').replace('-!', '!')
+    sections = diff_output.split('!')
+
+    # index the sections by line, a line is included in a section only if it is a complete line
+    changed_lines_set = set(changed_lines)
+    sections_index = {}
+    sections_lines = []
+    for section_number, section in enumerate(sections):
+        # the first line is the end of the line with the '!' character, or the diff header
+        section_lines = section.splitlines()[1:]
+        sections_lines.append(section_lines)
+        for line in section_lines:
+            if line in changed_lines_set:
+                sections_index.setdefault(line, []).append(section_number)
+
+    # select the sections that include changes, in the order of the changes
+    all_changes = []
+    sections_info = []
+    selected_sections = set()
+    for line in changed_lines:
+        for section_number in sections_index.pop(line, []):
+            section = sections[section_number]
+            if section in selected_sections:
+                continue
+            selected_sections.add(section)
+            all_changes.append(section)
+
+            # the section header is the first top level command, or the first line if no top level command
+            section_info = {'section': '', 'added': [], 'removed': []}
+            first_line = ''
+            for section_line in sections_lines[section_number]:
+                if section_line.startswith('@@') or not section_line[1:].strip():
+                    continue
+                first_line = first_line or section_line[1:].strip()
+                if not section_info['section'] and not section_line[1:].startswith(' '):
+                    section_info['section'] = section_line[1:].strip()
+                if section_line in changed_lines_set:
+                    if section_line.startswith('+'):
+                        section_info['added'].append(section_line[1:])
+                    else:
+                        section_info['removed'].append(section_line[1:])
+            section_info['section'] = section_info['section'] or first_line
+            sections_info.append(section_info)
+
+    # create a config_text string with all the sections that include changes
+    config_text = ''.join(all_changes)
+    return config_text, sections_info
+
 
 def compare_configs(cfg1, cfg2):
     """
@@ -38,279 +145,587 @@ def compare_configs(cfg1, cfg2):
     that include the changes
     """
 
-    # open the old and new configuration fiels
-    f1 = open(cfg1, 'r')
-    old_cfg = f1.readlines()
-    f1.close()
-
-    f2 = open(cfg2, 'r')
-    new_cfg = f2.readlines()
-    f2.close()
-
-    # compare the two specified config files {cfg1} and {cfg2}
-    d = difflib.unified_diff(old_cfg, new_cfg, n=9)
-
-    # create a diff_list that will include all the lines that changed
-    # create a diff_output string that will collect the generator output from the unified_diff function
-    diff_list = []
-    diff_output = ''
-
-    for line in d:
-        diff_output += line
-        if line.find('Current configuration') == -1:
-            if line.find('Last configuration change') == -1:
-                if (line.find('+++') == -1) and (line.find('---') == -1):
-                    if (line.find('-!') == -1) and (line.find('+!') == -1):
-                        if line.startswith('+'):
-                            diff_list.append('\n' + line)
-                        elif line.startswith('-'):
-                            diff_list.append('\n' + line)
-
-    # process the diff_output to select only the sections between '!' characters for the sections that changed,
-    # replace the empty '+' or '-' lines with space
-    diff_output = diff_output.replace('+!', '!')
-    diff_output = diff_output.replace('-!', '!')
-    diff_output_list = diff_output.split('!')
+    config_text, sections_info = compare_config_sections(read_config_lines(cfg1), read_config_lines(cfg2))
+    return config_text
 
-    all_changes = []
 
-    for changes in diff_list:
-        for config_changes in diff_output_list:
-            if changes in config_changes:
-                if config_changes not in all_changes:
-                    all_changes.append(config_changes)
+def read_config_lines(filename):
+    """
+    This function will read the configuration lines from the file {filename}
+    :param filename: configuration file path and filename
+    :return: list with the configuration lines
+    """
+    with open(filename, 'r') as f:
+        return f.readlines()
+
 
-    # create a config_text string with all the sections that include changes
-    config_text = ''
-    for items in all_changes:
-        config_text += items
+def get_sections_summary(sections_info):
+    """
+    This function will return a summary of the changed configuration sections, one line for each section
+    :param sections_info: list with the changed sections, from the function {compare_config_sections}
+    :return: text with the changed sections, and the number of added and removed lines for each section
+    """
+    summary = ''
+    for section_info in sections_info:
+        summary += '\n' + section_info['section'] + ': ' + str(len(section_info['added'])) + ' lines added, ' + \
+                   str(len(section_info['removed'])) + ' lines removed'
+    return summary
 
-    return config_text
 
+def get_changed_ipv4_config(config_hash, sections_info):
+    """
+    This function will return the configuration for the IPv4 addresses added by the configuration changes. For each
+    changed interface section, the 'ip address' commands are looked up in the parsed configuration snapshot with the
+    hash {config_hash}, and only the commands added by the changes are selected.
+    The added 'ip address' commands from the sections without an interface header are included without the interface
+    :param config_hash: hash of the new configuration snapshot
+    :param sections_info: list with the changed sections, from the function {compare_config_sections}
+    :return: configuration text, with the interfaces and the added IPv4 address commands, or '' if no IPv4 addresses
+    """
+    tree = config_parser.parse_snapshot(config_hash)
+    config_lines = []
+    for section_info in sections_info:
+        added_commands = set(line.strip() for line in section_info['added'])
+        section_type, section_name = config_parser.get_section_type(section_info['section'])
+        node = None
+        if section_type == 'interface':
+            node = config_parser.get_section(tree, 'interface', section_name)
+        if node is not None:
+            commands = [command for command in config_parser.get_children_commands(node, 'ip address')
+                        if command in added_commands]
+            if commands:
+                config_lines.append('interface ' + section_name)
+                config_lines += [' ' + command for command in commands]
+                config_lines.append('!')
+        else:
+            for command in sorted(added_commands):
+                if command.startswith('ip address '):
+                    config_lines += ['!', ' ' + command, '!']
+    if not config_lines:
+        return ''
+    return '!\n' + '\n'.join(config_lines) + '\n'
+
+
+def save_changes_ipv4_config(ipv4_config, temp_config_file):
+    """
+    This function will save the IPv4 addresses configuration {ipv4_config} to the file {temp_config_file}
+    :param ipv4_config: configuration text with the IPv4 addresses, from the function {get_changed_ipv4_config}
+    :param temp_config_file: temp file used to save the IPv4 addresses configuration
+    :return:
+    """
+    with open(temp_config_file, 'w') as f_diff:
+        f_diff.write(ipv4_config)
+
+
+def check_changes_ipv4_duplicate(ipv4_config, temp_config_file, dnac_token):
+    """
+    This function will check if the IPv4 addresses configured by the configuration changes will create duplicated
+    IPv4 addresses
+    :param ipv4_config: configuration text with the IPv4 addresses, from the function {get_changed_ipv4_config}
+    :param temp_config_file: temp file used to save the IPv4 addresses configuration
+    :param dnac_token: DNA C token
+    :return: True/False
+    """
+    if not ipv4_config:
+        return False
+    save_changes_ipv4_config(ipv4_config, temp_config_file)
+    return dnac_apis.check_ipv4_duplicate(temp_config_file, dnac_token)
+
+
+def check_changes_ipv4_overlap(ipv4_config, temp_config_file, dnac_token, device):
+    """
+    This function will check if the IPv4 subnets configured by the configuration changes overlap subnets configured
+    on other network devices
+    :param ipv4_config: configuration text with the IPv4 addresses, from the function {get_changed_ipv4_config}
+    :param temp_config_file: temp file used to save the IPv4 addresses configuration
+    :param dnac_token: DNA C token
+    :param device: device hostname
+    :return: True/False
+    """
+    if not ipv4_config:
+        return False
+    save_changes_ipv4_config(ipv4_config, temp_config_file)
+    overlaps = dnac_apis.check_ipv4_overlap(temp_config_file, dnac_token, device)
+    for network, overlap_network, interface_info in overlaps:
+        print('Device: ' + device + ' - The IPv4 subnet ' + str(network) + ' overlaps ' + str(overlap_network) +
+              ' configured on ' + interface_info['hostname'] + ' ' + interface_info['interface'])
+    return len(overlaps) > 0
+
+
+def refresh_device_ipv4_index(device, dnac_token):
+    """
+    This function will refresh the IPv4 addresses of the device with the name {device} in the local IPv4 index, after
+    the device configuration was saved or rolled back. The device interfaces are downloaded after the DNA C sync for
+    the device is completed, if the sync fails the full index is downloaded with the next lookup. The next duplicate
+    and overlap checks will not use the old addresses for this device
+    :param device: device hostname
+    :param dnac_token: DNA C token
+    :return:
+    """
+    device_id = dnac_apis.get_device_id_name(device, dnac_token)
+    if device_id is None:
+        return
+    try:
+        status_code, task_id = dnac_apis.sync_device(device, dnac_token)
+        task_info = dnac_apis.check_task_id_output(task_id, dnac_token)
+        if task_info.get('isError'):
+            raise ValueError(task_info.get('failureReason', 'task failed'))
+    except Exception as error:
+        print('Device: ' + device + ' - DNA C sync not completed: ' + str(error))
+        dnac_apis.invalidate_ipv4_index()
+        return
+    dnac_apis.refresh_ipv4_index_devices([device_id], dnac_token)
+
+
+def monitor_device(device, device_run_config, dnac_token):
+    """
+    This function will run the configuration monitoring pipeline for the device with the name {device}: compare the
+    running configuration {device_run_config} with the baseline configuration, create the ServiceNow incident, validate the
+    compliance and roll back, or save, the configuration.
+    Each device uses its own snapshots and temp files, the function could run in parallel for multiple devices
+    :param device: device hostname
+    :param device_run_config: device running configuration
+    :param dnac_token: DNA C token
+    :return: True if the device configuration matches the baseline configuration: no configuration changes, changes
+    approved and saved as the new baseline, or roll back confirmed by the device. False if not
+    """
+
+    temp_config_file = str(device) + '_temp_config_file.txt'
+
+    # check if device has a baseline configuration (to account for newly discovered DNA C devices)
+    # if yes, compare the configuration hashes, and run the diff function only if the hashes are different
+    # if not, save the device configuration as the baseline in the local snapshot store
+
+    baseline_hash = config_store.get_baseline_hash(device)
+    new_config_hash = config_store.get_config_hash(device_run_config)
+
+    if baseline_hash is not None:
+        diff = ''
+        sections_info = []
+        if new_config_hash != baseline_hash:
+            config_store.save_snapshot(device_run_config)
+            diff, sections_info = compare_config_sections(
+                read_config_lines(config_store.get_snapshot_path(baseline_hash)),
+                read_config_lines(config_store.get_snapshot_path(new_config_hash)))
+
+        if diff != '':
+
+            # retrieve the device location using DNA C REST APIs
+            location = dnac_apis.get_device_location(device, dnac_token)
+
+            # find the users that made configuration changes
+            user_info = 'User info no available'
+            for line in device_run_config.splitlines(True):
+                if 'Last configuration change' in line:
+                    user_info = line
+
+            # get the device management IP address
+            device_mngmnt_ip_address = dnac_apis.get_device_management_ip(device, dnac_token)
+
+            # define the incident description and comment
+            short_description = "Configuration Change Alert - " + device
+            comment = "The device with the name: " + device + "\nhas detected a Configuration Change"
+            comment += "\n\nThe device location is: " + location
+            comment += "\n\nThe device management IP address is: " + device_mngmnt_ip_address
+            comment += "\n\nThe changed configuration sections are:" + get_sections_summary(sections_info)
+            comment += "\n\nThe configuration changes are\n" + diff + "\n\n" + user_info
+
+            print(comment)
+            baseline_match = False
+
+            # create ServiceNow incident using ServiceNow APIs
+            incident = service_now_apis.create_incident(short_description, comment, SNOW_DEV, 3)
+
+            # start the compliance validation, all the rules are evaluated at once
+            # the duplicate IPv4 and subnet overlap rules check the IPv4 addresses from the configuration changes
+            # the IPv4 addresses added by the changes are looked up in the parsed configuration, once for both rules
+            ipv4_config = get_changed_ipv4_config(new_config_hash, sections_info)
+
+            def check_duplicate_ipv4(changes):
+                return check_changes_ipv4_duplicate(ipv4_config, temp_config_file, dnac_token)
+
+            def check_subnet_overlap(changes):
+                return check_changes_ipv4_overlap(ipv4_config, temp_config_file, dnac_token, device)
+
+            # the ACL and logging rules compare the sections from the parsed baseline and new configurations
+            trees = (config_parser.parse_snapshot(baseline_hash), config_parser.parse_snapshot(new_config_hash))
+            violations, passed = compliance_rules.evaluate_rules(diff, {'duplicate_ipv4': check_duplicate_ipv4,
+                                                                        'subnet_overlap': check_subnet_overlap},
+                                                                 trees=trees)
+            validation_result = 'Pass'
+            validation_comment = ''
+            for rule in passed:
+                validation_comment += '\nPassed ' + rule['name']
+
+            # report all the failed rules with one incident comment, the incident updates are queued and sent
+            # together with one API call
+            if violations:
+                comment = ''
+                for rule in violations:
+                    comment += '\n' + rule['fail_comment']
+                service_now_apis.queue_incident_update(incident, comment, SNOW_DEV)
+                validation_result = 'Failed'
+
+            # procedure to restore configurations as policy validations failed
+            if validation_result == 'Failed':
+                comment = 'Configuration changes do not pass validation,\nConfiguration roll back initiated'
+                service_now_apis.queue_incident_update(incident, comment, SNOW_DEV)
+
+                # start the config roll back, and wait for the roll back result from the device
+                reply = pubnub_apis.send_command(device + '#oper#configure replace nvram:startup-config force')
+                refresh_device_ipv4_index(device, dnac_token)
+                if reply['status'] == 'success':
+                    baseline_match = True
+                    comment = 'Configuration rolled back successfully'
+                    service_now_apis.queue_incident_update(incident, comment, SNOW_DEV)
+                    # close ServiceNow incident
+                    service_now_apis.queue_close_incident(incident, SNOW_DEV)
+                else:
+                    comment = 'Configuration rolled back not successful, status: ' + reply['status']
+                    service_now_apis.queue_incident_update(incident, comment, SNOW_DEV)
+
+            # start procedure to ask for approval as validation passed
+            else:
+                service_now_apis.queue_incident_update(incident, 'Approve these changes (YES/NO)?\n' + validation_comment, SNOW_DEV)
+                service_now_apis.queue_incident_update(incident, 'Waiting for Management Approval', SNOW_DEV)
+                service_now_apis.flush_incident_updates(incident)
+
+                # start the approval YES/NO procedure
+                # start a loop to check for 2 min if approved of not
+                approval = 'NO'
+                timer_count = 0
+                while timer_count <= 5:
+                    # one API call for each loop, only the comments added since the previous loop are downloaded
+                    answer = service_now_apis.find_new_comment(incident, ['YES', 'NO'])
+                    if answer == 'YES':
+
+                        # start the save of running config to startup config, establish new baseline
+                        reply = pubnub_apis.send_command(device + '#oper#save running-config startup-config')
+
+                        # save the approved running config as the device baseline
+                        config_store.set_baseline(device, device_run_config)
+                        refresh_device_ipv4_index(device, dnac_token)
+
+                        approval = 'YES'
+                        baseline_match = True
+
+                        # update ServiceNow incident
+                        if reply['status'] != 'success':
+                            comment = ('Saving the device configuration to the startup configuration not confirmed, '
+                                       'status: ' + reply['status'])
+                            service_now_apis.queue_incident_update(incident, comment, SNOW_DEV)
+                        comment = 'Approval received, saved device configuration, establish new baseline configuration'
+                        service_now_apis.queue_incident_update(incident, comment, SNOW_DEV)
+                        service_now_apis.queue_close_incident(incident, SNOW_DEV)
+                        break
+                    elif answer == 'NO':
+                        break
+                    else:
+                        timer_count += 1
+                        time.sleep(10)
+                        if timer_count == 5:
+                            service_now_apis.queue_incident_update(incident, 'Approval Timeout', SNOW_DEV)
+
+                # check if Approval is 'NO' at the end of the timer
+                if approval == 'NO':
+
+                    # start the config roll back, and wait for the roll back result from the device
+                    reply = pubnub_apis.send_command(device + '#oper#configure replace nvram:startup-config force')
+                    refresh_device_ipv4_index(device, dnac_token)
+                    if reply['status'] == 'success':
+                        baseline_match = True
+                        comment = 'Configuration changes not approved,\nConfiguration rolled back successfully'
+                        service_now_apis.queue_incident_update(incident, comment, SNOW_DEV)
+                        service_now_apis.queue_close_incident(incident, SNOW_DEV)
+                    else:
+                        comment = ('Configuration changes not approved,\nConfiguration rolled back not successful, status: ' +
+                                   reply['status'])
+                        service_now_apis.queue_incident_update(incident, comment, SNOW_DEV)
+
+            # send all the pending incident updates
+            service_now_apis.flush_incident_updates(incident)
+            service_now_apis.reset_comment_cursor(incident)
+            return baseline_match
+
+        else:
+            print('Device: ' + device + ' - No configuration changes detected')
+
+    else:
+        config_store.set_baseline(device, device_run_config)
+    return True
 
-def main():
+
+def get_monitored_devices(dnac_token):
+    """
+    This function will return the DNA C managed devices to monitor: the switches and routers, for the PDX and NYC
+    locations. The devices info is from the local inventory index
+    :param dnac_token: DNA C token
+    :return: {hostname: device info}
+    """
+    all_devices_info = dnac_apis.get_device_inventory(dnac_token)['hostname'].values()
+    monitored_devices = {}
+    for device in all_devices_info:
+        if device['family'] == 'Switches and Hubs' or device['family'] == 'Routers':
+            if 'PDX' in device['hostname'] or 'NYC' in device['hostname']:
+                monitored_devices[device['hostname']] = device
+    return monitored_devices
+
+
+def get_running_configs(device_names, dnac_token):
+    """
+    This function will collect the running configs for the devices from the list {device_names}, using batched
+    command runner requests
+    :param device_names: list of device hostnames
+    :param dnac_token: DNA C token
+    :return: {hostname: running config}, the devices without a running config are not included
+    """
+    all_devices_output = dnac_apis.get_output_command_runner_batch(['show running-config'], device_names, dnac_token)
+    all_devices_run_config = {}
+    for device in device_names:
+        device_run_config = all_devices_output.get(device, {}).get('show running-config')
+        if device_run_config is None:
+            print('Device: ' + device + ' - Running configuration not available')
+        else:
+            all_devices_run_config[device] = device_run_config
+    return all_devices_run_config
+
+
+def get_change_marker(configuration):
+    """
+    This function will return the change marker from the configuration {configuration}, the line starting with
+    {CHANGE_MARKER_TEXT}, with the time and the user for the last change. The command runner output starts with the
+    command, the command line is not a marker
+    :param configuration: string with the configuration, or the output of the {CHANGE_MARKER_COMMAND} command
+    :return: change marker, or None if not found
+    """
+    for line in configuration.splitlines():
+        line = line.strip()
+        if line.startswith(CHANGE_MARKER_TEXT):
+            return line
+    return None
+
+
+def get_changed_devices(device_names, dnac_token):
+    """
+    This function will collect the change markers for the devices from the list {device_names}, using batched command
+    runner requests, and return the devices that could have configuration changes: the marker is different from the
+    marker saved for the last configuration processed, or not available, or the device does not have a baseline
+    :param device_names: list of device hostnames
+    :param dnac_token: DNA C token
+    :return: list of device hostnames
+    """
+    all_devices_output = dnac_apis.get_output_command_runner_batch([CHANGE_MARKER_COMMAND], device_names, dnac_token)
+    changed_devices = []
+    for device in device_names:
+        marker_output = all_devices_output.get(device, {}).get(CHANGE_MARKER_COMMAND)
+        marker = get_change_marker(marker_output) if marker_output else None
+        if marker is None or marker != config_store.get_device_marker(device) or \
+                config_store.get_baseline_hash(device) is None:
+            changed_devices.append(device)
+    return changed_devices
+
+
+def monitor_device_changes(device, device_run_config, dnac_token):
+    """
+    This function will run the configuration monitoring pipeline for the device, and save the change marker of the
+    processed running configuration if the device configuration matches the baseline configuration. The marker is not
+    saved if the pipeline failed, or if the roll back of the not approved or not compliant changes was not confirmed,
+    the device configuration will be processed again at the next poll
+    :param device: device hostname
+    :param device_run_config: device running configuration
+    :param dnac_token: DNA C token
+    :return: True if the device configuration matches the baseline configuration, False if not
+    """
+    if not monitor_device(device, device_run_config, dnac_token):
+        return False
+    marker = get_change_marker(device_run_config)
+    if marker is not None:
+        config_store.set_device_marker(device, marker)
+    return True
+
+
+def submit_monitor_devices(executor, device_names, dnac_token, precheck=True):
+    """
+    This function will collect the running configs for the devices from the list {device_names}, and submit the
+    configuration monitoring for each device to the executor {executor}.
+    If {precheck}, the change markers are collected first, and the running configs are collected only for the devices
+    with a new change marker
+    :param executor: thread pool executor
+    :param device_names: list of device hostnames
+    :param dnac_token: DNA C token
+    :param precheck: True to check the change markers first
+    :return: {hostname: future}
+    """
+    if precheck and device_names:
+        changed_devices = get_changed_devices(device_names, dnac_token)
+        changed_devices_set = set(changed_devices)
+        for device in device_names:
+            if device not in changed_devices_set:
+                print('Device: ' + device + ' - No configuration changes detected')
+        device_names = changed_devices
+    device_tasks = {}
+    if not device_names:
+        return device_tasks
+    for device, device_run_config in get_running_configs(device_names, dnac_token).items():
+        device_tasks[device] = executor.submit(monitor_device_changes, device, device_run_config, dnac_token)
+    return device_tasks
+
+
+def check_device_task(device, device_task):
+    """
+    This function will wait for the configuration monitoring for the device {device} to finish, and print the error.
+    A failure for one device will not stop the monitoring for the other devices
+    :param device: device hostname
+    :param device_task: future for the device configuration monitoring
+    :return:
+    """
+    try:
+        device_task.result()
+    except Exception as error:
+        print('Device: ' + device + ' - Configuration monitoring failed: ' + str(error))
+
+
+def get_poll_interval(device_info):
+    """
+    This function will return the next polling interval for the device, based on the device role, with a random
+    jitter of up to {POLL_JITTER}
+    :param device_info: device info, from the DNA C inventory
+    :return: polling interval, in seconds
+    """
+    poll_interval = POLL_INTERVALS.get(str(device_info.get('role')).upper(), DEFAULT_POLL_INTERVAL)
+    return poll_interval * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+
+def run_daemon(max_workers=MAX_WORKERS):
+    """
+    This function will monitor the device configuration changes continuously. Each device is polled with its own
+    interval, from {POLL_INTERVALS}, using a priority queue ordered by the next poll time. The first poll for each
+    device is spread randomly over the device polling interval, all the devices due at the same time are polled with
+    one batch of command runner requests, submitted to the executor.
+    The DNA C token, the device inventory, the IPv4 index and the ServiceNow caches are kept between polls, a new token
+    is requested every {DNAC_TOKEN_TTL} seconds, or after a failure. A failure will not stop the daemon, the devices
+    due for polling are polled again at their next interval
+    :param max_workers: maximum number of devices processed in parallel
+    """
+    dnac_token = None  # a new token is requested if None
+    token_time = 0
+    schedule = []  # the polling schedule - heap of (next poll time, hostname)
+    scheduled_devices = set()
+    monitored_devices = {}
+    poll_tasks = {}  # the batched running config collections in progress - {future: list of hostnames}
+    device_tasks = {}  # the devices with the configuration monitoring in progress - {hostname: future}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            now = time.time()
+            due_polls = []
+            tick_failed = False
+            try:
+                # check the completed running config collections, the configuration monitoring for each device is
+                # already submitted. The DNA C API errors are not reported with the status code, a new token is
+                # requested after any failure
+                polling_devices = set()
+                for poll_task, poll_devices in list(poll_tasks.items()):
+                    if not poll_task.done():
+                        polling_devices.update(poll_devices)
+                        continue
+                    del poll_tasks[poll_task]
+                    try:
+                        device_tasks.update(poll_task.result())
+                    except Exception as error:
+                        print('\nPolling failed for devices: ' + ', '.join(poll_devices) + ' - ' + str(error))
+                        dnac_token = None
+
+                if dnac_token is None or now - token_time > DNAC_TOKEN_TTL:
+                    dnac_token = dnac_apis.get_dnac_jwt_token(DNAC_AUTH)
+                    token_time = now
+
+                # schedule the new devices, the inventory is downloaded only when older than the inventory TTL
+                monitored_devices = get_monitored_devices(dnac_token)
+                for device, device_info in monitored_devices.items():
+                    if device not in scheduled_devices:
+                        first_poll = now + random.uniform(0, get_poll_interval(device_info))
+                        heapq.heappush(schedule, (first_poll, device))
+                        scheduled_devices.add(device)
+
+                # check the completed devices
+                for device, device_task in list(device_tasks.items()):
+                    if device_task.done():
+                        check_device_task(device, device_task)
+                        del device_tasks[device]
+
+                # collect the devices due for polling, the devices with the running config collection or the
+                # configuration monitoring in progress are polled at the next interval
+                while schedule and schedule[0][0] <= now:
+                    due_polls.append(heapq.heappop(schedule))
+                due_devices = []
+                for next_poll, device in due_polls:
+                    if device in monitored_devices and device not in device_tasks and device not in polling_devices:
+                        due_devices.append(device)
+
+                # the change markers and the running configs are collected by one of the executor threads
+                if due_devices:
+                    print('\nPolling ' + str(len(due_devices)) + ' devices: ' + ', '.join(due_devices))
+                    poll_task = executor.submit(submit_monitor_devices, executor, due_devices, dnac_token)
+                    poll_tasks[poll_task] = due_devices
+            except Exception as error:
+                print('\nConfiguration monitoring daemon error: ' + str(error))
+                dnac_token = None
+                tick_failed = True
+            finally:
+                # schedule the next poll for the due devices, the devices removed from the inventory are not scheduled
+                # again
+                for next_poll, device in due_polls:
+                    if device in monitored_devices:
+                        heapq.heappush(schedule, (now + get_poll_interval(monitored_devices[device]), device))
+                    else:
+                        scheduled_devices.discard(device)
+
+            # wait for the next device due for polling, or the next tick after a failure
+            sleep_time = DAEMON_TICK
+            if schedule and not tick_failed:
+                sleep_time = min(sleep_time, schedule[0][0] - time.time())
+            if sleep_time > 0:
+                time.sleep(sleep_time)
+
+
+def main(max_workers=MAX_WORKERS):
     """
     This script will monitor device configuration changes. It could be executed on demand as in this lab,
-    periodically (every 60 minutes, for example) or continuously.
+    periodically (every 60 minutes, for example) or continuously, with the '--daemon' option (see {run_daemon}).
     It will collect the configuration file for each DNA Center managed device, compare with the existing cached file,
     and detect if any changes.
     When changes detected, identify the last user that configured the device, and create a new ServiceNoe incident.
     Automatically roll back all non-compliant configurations, or save new configurations if approved in ServiceNow.
     Send Exec commands to devices using PubNub.
-    Compliance checks at this time:
+    Compliance checks at this time, declared in compliance_rules.COMPLIANCE_RULES:
     - no Access Control Lists changes
     - no logging changes
     - no duplicated IPv4 addresses
+    - no IPv4 subnets overlapping the subnets configured on other devices
+    :param max_workers: maximum number of devices processed in parallel
     """
 
     # get the DNA C auth token
     dnac_token = dnac_apis.get_dnac_jwt_token(DNAC_AUTH)
     print('\nDNA C AUTH TOKEN: ', dnac_token, '\n')
 
-    temp_run_config = 'temp_run_config.txt'
-
     # get the DNA C managed devices list (excluded wireless, for one location)
-    all_devices_info = dnac_apis.get_all_device_info(dnac_token)
-    all_devices_hostnames = []
-    for device in all_devices_info:
-        if device['family'] == 'Switches and Hubs' or device['family'] == 'Routers':
-            if 'PDX' in device['hostname'] or 'NYC' in device['hostname']:
-                all_devices_hostnames.append(device['hostname'])
-
-    # get the config files, compare with existing (if one existing). Save new config if file not existing.
-    for device in all_devices_hostnames:
-        device_run_config = dnac_apis.get_output_command_runner('show running-config', device, dnac_token)
-        filename = str(device) + '_run_config.txt'
-
-        # save the running config to a temp file
-
-        f_temp = open(temp_run_config, 'w')
-        f_temp.write(device_run_config)
-        f_temp.seek(0)  # reset the file pointer to 0
-        f_temp.close()
-
-        # check if device has an existing configuration file (to account for newly discovered DNA C devices)
-        # if yes, run the diff function
-        # if not, save the device configuration to the local device database
-        # this will create the local "database" of configs, one file/device
-
-        if os.path.isfile(filename):
-            diff = compare_configs(filename, temp_run_config)
-
-            if diff != '':
-
-                # retrieve the device location using DNA C REST APIs
-                location = dnac_apis.get_device_location(device, dnac_token)
-
-                # find the users that made configuration changes
-                with open(temp_run_config, 'r') as f:
-                    user_info = 'User info no available'
-                    for line in f:
-                        if 'Last configuration change' in line:
-                            user_info = line
-
-                # get the device management IP address
-                device_mngmnt_ip_address = dnac_apis.get_device_management_ip(device, dnac_token)
-
-                # define the incident description and comment
-                short_description = "Configuration Change Alert - " + device
-                comment = "The device with the name: " + device + "\nhas detected a Configuration Change"
-                comment += "\n\nThe device location is: " + location
-                comment += "\n\nThe device management IP address is: " + device_mngmnt_ip_address
-                comment += "\n\nThe configuration changes are\n" + diff + "\n\n" + user_info
-
-                print(comment)
-
-                # create ServiceNow incident using ServiceNow APIs
-                incident = service_now_apis.create_incident(short_description, comment, SNOW_DEV, 3)
-
-                # start the compliance validation
-                # ACL changes
-                validation_result = 'Pass'
-                validation_comment = ''
-                if 'access-list' in diff:
-                    comment = '\nValidation against ACL changes failed'
-                    service_now_apis.update_incident(incident, comment, SNOW_DEV)
-                    validation_result = 'Failed'
-                else:
-                    validation_comment = '\nPassed ACL Policy'
-
-                # logging changes
-                if 'logging' in diff:
-                    comment = '\nValidation against logging changes failed'
-                    service_now_apis.update_incident(incident, comment, SNOW_DEV)
-                    validation_result = 'Failed'
-                else:
-                    validation_comment += '\nPassed Logging Policy'
-
-                # IPv4 duplicates
-                diff_list = diff.split('\n')
-                diff_config = '!\n'
-                for command in diff_list:
-                    if 'ip address' in command:
-                        diff_config += command.replace('+', '') + '\n!'
-
-                # save the diff config that include only IP addresses in a file
-                f_diff = open('temp_config_file.txt', 'w')
-                f_diff.write(diff_config)
-                f_diff.seek(0)  # reset the file pointer to 0
-                f_diff.close()
-
-                duplicate_ip_result = dnac_apis.check_ipv4_duplicate('temp_config_file.txt')
-                if duplicate_ip_result:
-                    comment = '\nValidation against duplicated IPv4 addresses failed'
-                    service_now_apis.update_incident(incident, comment, SNOW_DEV)
-                    validation_result = 'Failed'
-                else:
-                    validation_comment += '\nPassed Duplicate IPv4 Prevention'
-
-                # procedure to restore configurations as policy validations failed
-                if validation_result == 'Failed':
-                    comment = 'Configuration changes do not pass validation,\nConfiguration roll back initiated'
-                    service_now_apis.update_incident(incident, comment, SNOW_DEV)
-
-                    # start the config roll back
-                    pubnub_apis.pub_message(device + '#oper#configure replace nvram:startup-config force')
-
-                    # check if rollback is successful after 3 seconds
-                    time.sleep(3)
-                    device_run_config = dnac_apis.get_output_command_runner('show running-config', device, dnac_token)
-                    filename = str(device) + '_run_config.txt'
-
-                    # save the running config to a temp file
-                    f_temp = open(temp_run_config, 'w')
-                    f_temp.write(device_run_config)
-                    f_temp.seek(0)  # reset the file pointer to 0
-                    f_temp.close()
-
-                    diff = compare_configs(filename, temp_run_config)
-                    if diff != ' ':
-                        comment = 'Configuration rolled back successfully'
-                        service_now_apis.update_incident(incident, comment, SNOW_DEV)
-                        # close ServiceNow incident
-                        service_now_apis.close_incident(incident,SNOW_DEV)
-                    else:
-                        comment = 'Configuration rolled back not successful'
-                        service_now_apis.update_incident(incident, comment, SNOW_DEV)
-
-                # start procedure to ask for approval as validation passed
-                else:
-                    service_now_apis.update_incident(incident, 'Approve these changes (YES/NO)?\n' + validation_comment, SNOW_DEV)
-                    service_now_apis.update_incident(incident, 'Waiting for Management Approval', SNOW_DEV)
-
-                    # start the approval YES/NO procedure
-                    # start a loop to check for 2 min if approved of not
-                    approval = 'NO'
-                    timer_count = 0
-                    while timer_count <= 5:
-                        if service_now_apis.find_comment(incident, 'YES'):
-
-                            # start the save of running config to startup config, establish new baseline
-                            pubnub_apis.pub_message(device + '#oper#save running-config startup-config')
-
-                            # establish new baseline config
-                            time.sleep(3)
-                            device_run_config = dnac_apis.get_output_command_runner('show running-config', device, dnac_token)
-                            filename = str(device) + '_run_config.txt'
-
-                            # save the running config to teh device config file
-                            f_temp = open(filename, 'w')
-                            f_temp.write(device_run_config)
-                            f_temp.seek(0)  # reset the file pointer to 0
-                            f_temp.close()
-
-                            approval = 'YES'
-
-                            # update ServiceNow incident
-                            comment = 'Approval received, saved device configuration, establish new baseline configuration'
-                            service_now_apis.update_incident(incident, comment, SNOW_DEV)
-                            service_now_apis.close_incident(incident, SNOW_DEV)
-                            break
-                        elif service_now_apis.find_comment(incident, 'NO'):
-                            break
-                        else:
-                            timer_count += 1
-                            time.sleep(10)
-                            if timer_count == 5:
-                                service_now_apis.update_incident(incident, 'Approval Timeout', SNOW_DEV)
-
-                    # check if Approval is 'NO' at the end of the timer
-                    if approval == 'NO':
-
-                        # start the config roll back
-                        pubnub_apis.pub_message(device + '#oper#configure replace nvram:startup-config force')
-
-                        # check if rollback is successful after 3 seconds
-                        time.sleep(3)
-                        device_run_config = dnac_apis.get_output_command_runner('show running-config', device,
-                                                                                dnac_token)
-                        # save the running config to a temp file
-                        f_temp = open(temp_run_config, 'w')
-                        f_temp.write(device_run_config)
-                        f_temp.seek(0)  # reset the file pointer to 0
-                        f_temp.close()
-
-                        filename = str(device) + '_run_config.txt'
-
-                        diff = compare_configs(filename, temp_run_config)
-                        if diff != ' ':
-                            comment = 'Configuration changes not approved,\nConfiguration rolled back successfully'
-                            service_now_apis.update_incident(incident, comment, SNOW_DEV)
-                            service_now_apis.close_incident(incident, SNOW_DEV)
-                        else:
-                            comment = 'Configuration changes not approved,\nConfiguration rolled back not successful'
-                            service_now_apis.update_incident(incident, comment, SNOW_DEV)
-
-            else:
-                print('Device: ' + device + ' - No configuration changes detected')
-
-        else:
-            f_config = open(filename, "w")
-            f_config.write(device_run_config)
-            f_config.seek(0)
-            f_config.close()
+    # the inventory and the IPv4 index are downloaded once for each pass, all the lookups will use the local indexes
+    dnac_apis.invalidate_device_inventory()
+    dnac_apis.invalidate_ipv4_index()
+    all_devices_hostnames = list(get_monitored_devices(dnac_token))
 
+    # collect the running configs for all devices, compare with the baseline (if one existing), save the baseline if
+    # not existing. The devices are processed in parallel, with maximum {max_workers} devices at a time
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        device_tasks = submit_monitor_devices(executor, all_devices_hostnames, dnac_token)
+        for device, device_task in device_tasks.items():
+            check_device_task(device, device_task)
 
 
 if __name__ == '__main__':
-    main()
+    if len(sys.argv) > 1 and sys.argv[1] == '--daemon':
+        run_daemon()
+    else:
+        main()
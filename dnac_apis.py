@@ -11,18 +11,69 @@ import os.path
 import urllib3
 import socket
 import re
+import threading
 import utils
 
 from urllib3.exceptions import InsecureRequestWarning  # for insecure https warnings
 from requests.auth import HTTPBasicAuth  # for Basic Auth
+from requests.adapters import HTTPAdapter  # for the connection pool
 
 from config import DNAC_URL, DNAC_PASS, DNAC_USER
 
+try:
+    import ipaddress
+except ImportError:
+    ipaddress = None  # Guest Shell Python 2, the IPv4 prefix index is not available
+
 
 urllib3.disable_warnings(InsecureRequestWarning)  # disable insecure https warnings
 
 DNAC_AUTH = HTTPBasicAuth(DNAC_USER, DNAC_PASS)
 
+DNAC_POOL_SIZE = 20  # number of keep-alive connections kept open to each host
+
+DEVICE_PAGE_SIZE = 500  # maximum number of devices returned by DNA C for one inventory request
+
+COMMAND_RUNNER_MAX_COMMANDS = 5  # maximum number of CLI commands for each command runner request
+COMMAND_RUNNER_MAX_DEVICES = 100  # maximum number of devices for each command runner request
+
+TASK_POLL_INITIAL_DELAY = 0.25  # first wait time when polling for tasks, in seconds
+TASK_POLL_MAX_DELAY = 5  # maximum wait time when polling for tasks, in seconds
+TASK_TIMEOUT = 300  # maximum time to wait for a task to complete, in seconds
+
+INVENTORY_TTL = 300  # seconds the local device inventory index is valid, before it is downloaded again
+INVENTORY_KEYS = ['hostname', 'id', 'serialNumber', 'managementIpAddress']  # device inventory index keys
+
+DEVICE_INVENTORY = {'timestamp': 0}  # local device inventory index, one dict for each of the {INVENTORY_KEYS}
+DEVICE_INVENTORY_LOCK = threading.Lock()
+
+IPV4_INDEX_TTL = 900  # seconds the local IPv4 address index is valid, before it is downloaded again
+INTERFACE_PAGE_SIZE = 500  # maximum number of interfaces returned by DNA C for one request
+HOST_PAGE_SIZE = 500  # maximum number of hosts returned by DNA C for one request
+
+# local IPv4 address index, with the interfaces and clients IPv4 addresses, and the addresses for each device id
+IPV4_INDEX = {'timestamp': 0, 'interfaces': {}, 'clients': {}, 'devices': {}}
+IPV4_INDEX_LOCK = threading.Lock()
+
+
+def dnac_session_init(pool_size=DNAC_POOL_SIZE):
+    """
+    Create the HTTP session shared by all DNA C API calls. The session keeps the TCP/TLS connections open between calls
+    and will allow up to {pool_size} concurrent connections to each host
+    :param pool_size: maximum number of connections to keep open for each host
+    :return: requests session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    session.verify = False
+    session.headers.update({'content-type': 'application/json'})
+    return session
+
+
+DNAC_SESSION = dnac_session_init()
+
 
 def pprint(json_data):
     """
@@ -44,8 +95,11 @@ def get_dnac_jwt_token(dnac_auth):
     url = DNAC_URL + '/dna/system/api/v1/auth/token'
     print(url)
     header = {'content-type': 'application/json'}
-    response = requests.post(url, auth=dnac_auth, headers=header, verify=False)
+    response = DNAC_SESSION.post(url, auth=dnac_auth, headers=header, verify=False)
     dnac_jwt_token = response.json()['Token']
+
+    # save the token as a default header, to be sent with all the following calls
+    DNAC_SESSION.headers.update({'x-auth-token': dnac_jwt_token})
     return dnac_jwt_token
 
 
@@ -55,11 +109,81 @@ def get_all_device_info(dnac_jwt_token):
     :param dnac_jwt_token: DNA C token
     :return: DNA C device inventory info
     """
-    url = DNAC_URL + '/api/v1/network-device'
+    return list(iter_all_device_info(dnac_jwt_token))
+
+
+def get_device_info_page(offset, limit, dnac_jwt_token):
+    """
+    The function will return one page of the network devices inventory, {limit} devices starting with {offset}
+    :param offset: index of the first device, starting with 1
+    :param limit: number of devices to return
+    :param dnac_jwt_token: DNA C token
+    :return: list with the devices info
+    """
+    url = DNAC_URL + '/api/v1/network-device?offset=' + str(offset) + '&limit=' + str(limit)
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    all_device_response = requests.get(url, headers=header, verify=False)
-    all_device_info = all_device_response.json()
-    return all_device_info['response']
+    device_page_response = DNAC_SESSION.get(url, headers=header, verify=False)
+    device_page_info = device_page_response.json()
+    return device_page_info['response']
+
+
+def iter_all_device_info(dnac_jwt_token, page_size=DEVICE_PAGE_SIZE, prefetch=True):
+    """
+    This generator will walk the network devices inventory, one page at a time, and yield each device info.
+    If {prefetch} is True, the next page is downloaded while the current page is processed
+    :param dnac_jwt_token: DNA C token
+    :param page_size: number of devices for each request
+    :param prefetch: True to download the next page in the background
+    :return: device info, one device at a time
+    """
+    def fetch_page(offset, limit):
+        return get_device_info_page(offset, limit, dnac_jwt_token)
+
+    return utils.iter_pages(fetch_page, page_size, first_offset=1, prefetch=prefetch)
+
+
+def get_device_inventory(dnac_jwt_token, ttl=INVENTORY_TTL):
+    """
+    The function will return the local device inventory index, with the devices info keyed by hostname, id,
+    serial number and management IP address. The inventory is downloaded from DNA C only if the index is older
+    than {ttl} seconds, or it was invalidated
+    :param dnac_jwt_token: DNA C token
+    :param ttl: index time to live, in seconds
+    :return: device inventory index - {key: {value: device info}}
+    """
+    with DEVICE_INVENTORY_LOCK:
+        if time.time() - DEVICE_INVENTORY['timestamp'] > ttl:
+            inventory = {}
+            for key in INVENTORY_KEYS:
+                inventory[key] = {}
+            for device in iter_all_device_info(dnac_jwt_token):
+                for key in INVENTORY_KEYS:
+                    if device.get(key):
+                        inventory[key][device[key]] = device
+            DEVICE_INVENTORY.update(inventory)
+            DEVICE_INVENTORY['timestamp'] = time.time()
+        return DEVICE_INVENTORY
+
+
+def invalidate_device_inventory():
+    """
+    The function will invalidate the local device inventory index, the next lookup will download the inventory
+    :return:
+    """
+    with DEVICE_INVENTORY_LOCK:
+        DEVICE_INVENTORY['timestamp'] = 0
+
+
+def get_inventory_device_info(key, value, dnac_jwt_token):
+    """
+    The function will return the device info from the local device inventory index, for the device with the
+    {key} equal to {value}
+    :param key: one of the {INVENTORY_KEYS} - hostname, id, serialNumber or managementIpAddress
+    :param value: the value to search for
+    :param dnac_jwt_token: DNA C token
+    :return: device info, or None if the device is not found
+    """
+    return get_device_inventory(dnac_jwt_token)[key].get(value)
 
 
 def get_device_info(device_id, dnac_jwt_token):
@@ -71,7 +195,7 @@ def get_device_info(device_id, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/network-device?id=' + device_id
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    device_response = requests.get(url, headers=header, verify=False)
+    device_response = DNAC_SESSION.get(url, headers=header, verify=False)
     device_info = device_response.json()
     return device_info['response'][0]
 
@@ -85,7 +209,7 @@ def get_project_id(project_name, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/template-programmer/project?name=' + project_name
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     proj_json = response.json()
     proj_id = proj_json[0]['id']
     return proj_id
@@ -100,7 +224,7 @@ def get_project_info(project_name, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/template-programmer/project?name=' + project_name
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     project_json = response.json()
     template_list = project_json[0]['templates']
     return template_list
@@ -150,7 +274,7 @@ def create_commit_template(template_name, project_name, cli_template, dnac_jwt_t
     # create the new template
     url = DNAC_URL + '/api/v1/template-programmer/project/' + project_id + '/template'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    response = DNAC_SESSION.post(url, data=json.dumps(payload), headers=header, verify=False)
 
     # get the template id
     template_id = get_template_id(template_name, project_name, dnac_jwt_token)
@@ -173,7 +297,7 @@ def commit_template(template_id, comments, dnac_jwt_token):
             "comments": comments
         }
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    response = DNAC_SESSION.post(url, data=json.dumps(payload), headers=header, verify=False)
 
 
 def update_commit_template(template_name, project_name, cli_template, dnac_jwt_token):
@@ -217,7 +341,7 @@ def update_commit_template(template_name, project_name, cli_template, dnac_jwt_t
         "parentTemplateId": project_id
     }
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.put(url, data=json.dumps(payload), headers=header, verify=False)
+    response = DNAC_SESSION.put(url, data=json.dumps(payload), headers=header, verify=False)
 
     # commit template
     commit_template(template_id, 'committed by Python script', dnac_jwt_token)
@@ -250,7 +374,7 @@ def delete_template(template_name, project_name, dnac_jwt_token):
     template_id = get_template_id(template_name, project_name, dnac_jwt_token)
     url = DNAC_URL + '/api/v1/template-programmer/template/' + template_id
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.delete(url, headers=header, verify=False)
+    response = DNAC_SESSION.delete(url, headers=header, verify=False)
 
 
 def get_all_template_info(dnac_jwt_token):
@@ -261,7 +385,7 @@ def get_all_template_info(dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/template-programmer/template'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     all_template_list = response.json()
     return all_template_list
 
@@ -277,7 +401,7 @@ def get_template_name_info(template_name, project_name, dnac_jwt_token):
     template_id = get_template_id(template_name, project_name, dnac_jwt_token)
     url = DNAC_URL + '/api/v1/template-programmer/template/' + template_id
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     template_json = response.json()
     return template_json
 
@@ -311,7 +435,7 @@ def get_template_id_version(template_name, project_name, dnac_jwt_token):
     project_id = get_project_id(project_name, dnac_jwt_token)
     url = DNAC_URL + '/api/v1/template-programmer/template?projectId=' + project_id + '&includeHead=false'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     project_json = response.json()
     for template in project_json:
         if template['name'] == template_name:
@@ -348,7 +472,7 @@ def deploy_template(template_name, project_name, device_name, dnac_jwt_token):
         }
     url = DNAC_URL + '/api/v1/template-programmer/template/deploy'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.post(url, headers=header, data=json.dumps(payload), verify=False)
+    response = DNAC_SESSION.post(url, headers=header, data=json.dumps(payload), verify=False)
     depl_task_id = (response.json())["deploymentId"]
     return depl_task_id
 
@@ -362,7 +486,7 @@ def check_template_deployment_status(depl_task_id, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/template-programmer/template/deploy/status/' + depl_task_id
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     response_json = response.json()
     deployment_status = response_json["status"]
     return deployment_status
@@ -377,7 +501,7 @@ def get_client_info(client_ip, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/host?hostIp=' + client_ip
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     client_json = response.json()
     try:
         client_info = client_json['response'][0]
@@ -413,10 +537,9 @@ def get_device_id_name(device_name, dnac_jwt_token):
     :return:
     """
     device_id = None
-    device_list = get_all_device_info(dnac_jwt_token)
-    for device in device_list:
-        if device['hostname'] == device_name:
-            device_id = device['id']
+    device_info = get_inventory_device_info('hostname', device_name, dnac_jwt_token)
+    if device_info is not None:
+        device_id = device_info['id']
     return device_id
 
 
@@ -429,11 +552,10 @@ def get_device_status(device_name, dnac_jwt_token):
                       {SUCCESS} device reachable
                       {FAILURE} device not reachable
     """
-    device_id = get_device_id_name(device_name, dnac_jwt_token)
-    if device_id is None:
+    device_info = get_inventory_device_info('hostname', device_name, dnac_jwt_token)
+    if device_info is None:
         return 'UNKNOWN'
     else:
-        device_info = get_device_info(device_id, dnac_jwt_token)
         if device_info['reachabilityStatus'] == 'Reachable':
             return 'SUCCESS'
         else:
@@ -448,10 +570,9 @@ def get_device_management_ip(device_name, dnac_jwt_token):
     :return: the management ip address
     """
     device_ip = None
-    device_list = get_all_device_info(dnac_jwt_token)
-    for device in device_list:
-        if device['hostname'] == device_name:
-            device_ip = device['managementIpAddress']
+    device_info = get_inventory_device_info('hostname', device_name, dnac_jwt_token)
+    if device_info is not None:
+        device_ip = device_info['managementIpAddress']
     return device_ip
 
 
@@ -464,7 +585,7 @@ def get_device_id_sn(device_sn, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/network-device/serial-number/' + device_sn
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    device_response = requests.get(url, headers=header, verify=False)
+    device_response = DNAC_SESSION.get(url, headers=header, verify=False)
     device_info = device_response.json()
     device_id = device_info['response']['id']
     return device_id
@@ -480,7 +601,7 @@ def get_device_location(device_name, dnac_jwt_token):
     device_id = get_device_id_name(device_name, dnac_jwt_token)
     url = DNAC_URL + '/api/v1/group/member/' + device_id + '?groupType=SITE'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    device_response = requests.get(url, headers=header, verify=False)
+    device_response = DNAC_SESSION.get(url, headers=header, verify=False)
     device_info = (device_response.json())['response']
     device_location = device_info[0]['groupNameHierarchy']
     return device_location
@@ -513,7 +634,7 @@ def create_site(site_name, dnac_jwt_token):
     }
     url = DNAC_URL + '/api/v1/group'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    DNAC_SESSION.post(url, data=json.dumps(payload), headers=header, verify=False)
 
 
 def get_site_id(site_name, dnac_jwt_token):
@@ -526,7 +647,7 @@ def get_site_id(site_name, dnac_jwt_token):
     site_id = None
     url = DNAC_URL + '/api/v1/group?groupType=SITE'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    site_response = requests.get(url, headers=header, verify=False)
+    site_response = DNAC_SESSION.get(url, headers=header, verify=False)
     site_json = site_response.json()
     site_list = site_json['response']
     for site in site_list:
@@ -576,7 +697,7 @@ def create_building(site_name, building_name, address, dnac_jwt_token):
     }
     url = DNAC_URL + '/api/v1/group'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    DNAC_SESSION.post(url, data=json.dumps(payload), headers=header, verify=False)
 
 
 def get_building_id(building_name, dnac_jwt_token):
@@ -589,7 +710,7 @@ def get_building_id(building_name, dnac_jwt_token):
     building_id = None
     url = DNAC_URL + '/api/v1/group?groupType=SITE'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    building_response = requests.get(url, headers=header, verify=False)
+    building_response = DNAC_SESSION.get(url, headers=header, verify=False)
     building_json = building_response.json()
     building_list = building_json['response']
     for building in building_list:
@@ -647,7 +768,7 @@ def create_floor(building_name, floor_name, floor_number, dnac_jwt_token):
     }
     url = DNAC_URL + '/api/v1/group'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    DNAC_SESSION.post(url, data=json.dumps(payload), headers=header, verify=False)
 
 
 def get_floor_id(building_name, floor_name, dnac_jwt_token):
@@ -663,7 +784,7 @@ def get_floor_id(building_name, floor_name, dnac_jwt_token):
     building_id = get_building_id(building_name, dnac_jwt_token)
     url = DNAC_URL + '/api/v1/group' + building_id + '/child?level=1'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    building_response = requests.get(url, headers=header, verify=False)
+    building_response = DNAC_SESSION.get(url, headers=header, verify=False)
     building_json = building_response.json()
     floor_list = building_json['response']
     for floor in floor_list:
@@ -687,7 +808,7 @@ def assign_device_sn_building(device_sn, building_name, dnac_jwt_token):
     url = DNAC_URL + '/api/v1/group/' + building_id + '/member'
     payload = {"networkdevice": [device_id]}
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    response = DNAC_SESSION.post(url, data=json.dumps(payload), headers=header, verify=False)
     print('\nDevice with the SN: ', device_sn, 'assigned to building: ', building_name)
 
 
@@ -706,7 +827,7 @@ def assign_device_name_building(device_name, building_name, dnac_jwt_token):
     url = DNAC_URL + '/api/v1/group/' + building_id + '/member'
     payload = {"networkdevice": [device_id]}
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
+    response = DNAC_SESSION.post(url, data=json.dumps(payload), headers=header, verify=False)
     print('\nDevice with the name: ', device_name, 'assigned to building: ', building_name)
 
 
@@ -736,7 +857,7 @@ def sync_device(device_name, dnac_jwt_token):
     param = [device_id]
     url = DNAC_URL + '/api/v1/network-device/sync?forceSync=true'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    sync_response = requests.put(url, data=json.dumps(param), headers=header, verify=False)
+    sync_response = DNAC_SESSION.put(url, data=json.dumps(param), headers=header, verify=False)
     task = sync_response.json()['response']['taskId']
     return sync_response.status_code, task
 
@@ -750,7 +871,7 @@ def check_task_id_status(task_id, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/task/' + task_id
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    task_response = requests.get(url, headers=header, verify=False)
+    task_response = DNAC_SESSION.get(url, headers=header, verify=False)
     task_json = task_response.json()
     task_status = task_json['response']['isError']
     if not task_status:
@@ -760,26 +881,61 @@ def check_task_id_status(task_id, dnac_jwt_token):
     return task_result
 
 
-def check_task_id_output(task_id, dnac_jwt_token):
+def get_task_info(task_id, dnac_jwt_token):
     """
-    This function will check the status of the task with the id {task_id}. Loop one seconds increments until task is completed
+    This function will return the info for the task with the id {task_id}
     :param task_id: task id
     :param dnac_jwt_token: DNA C token
-    :return: status - {SUCCESS} or {FAILURE}
+    :return: task info, or None if the task info is not available
     """
     url = DNAC_URL + '/api/v1/task/' + task_id
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    completed = 'no'
-    while completed == 'no':
-        try:
-            task_response = requests.get(url, headers=header, verify=False)
-            task_json = task_response.json()
-            task_output = task_json['response']
-            task_output['endTime']
-            completed = 'yes'
-        except:
-            time.sleep(1)
-    return task_output
+    try:
+        task_response = DNAC_SESSION.get(url, headers=header, verify=False)
+        task_json = task_response.json()
+        return task_json['response']
+    except Exception:
+        return None
+
+
+def wait_for_tasks(task_ids, dnac_jwt_token, timeout=TASK_TIMEOUT):
+    """
+    This function will wait for all the tasks with the ids in the list {task_ids} to complete.
+    All pending tasks are checked in each polling round, a task is completed as soon as the task info includes the
+    {endTime}. The wait time between rounds starts with {TASK_POLL_INITIAL_DELAY} and it will grow, with jitter, up to
+    {TASK_POLL_MAX_DELAY}
+    :param task_ids: list of task ids
+    :param dnac_jwt_token: DNA C token
+    :param timeout: maximum time to wait for all tasks, in seconds
+    :return: tasks output - {task_id: task info}
+    """
+    deadline = time.time() + timeout
+    delays = utils.backoff_delays(TASK_POLL_INITIAL_DELAY, TASK_POLL_MAX_DELAY)
+    pending_tasks = list(task_ids)
+    tasks_output = {}
+    while True:
+        for task_id in list(pending_tasks):
+            task_output = get_task_info(task_id, dnac_jwt_token)
+            if task_output is not None and 'endTime' in task_output:
+                tasks_output[task_id] = task_output
+                pending_tasks.remove(task_id)
+        if not pending_tasks:
+            return tasks_output
+        delay = next(delays)
+        if time.time() + delay > deadline:
+            raise TimeoutError('DNA C tasks not completed in ' + str(timeout) + ' seconds: ' + ', '.join(pending_tasks))
+        time.sleep(delay)
+
+
+def check_task_id_output(task_id, dnac_jwt_token, timeout=TASK_TIMEOUT):
+    """
+    This function will check the status of the task with the id {task_id}. Poll, with backoff, until task is completed
+    :param task_id: task id
+    :param dnac_jwt_token: DNA C token
+    :param timeout: maximum time to wait for the task, in seconds
+    :return: task info
+    """
+    return wait_for_tasks([task_id], dnac_jwt_token, timeout)[task_id]
 
 
 def create_path_trace(src_ip, dest_ip, dnac_jwt_token):
@@ -800,7 +956,7 @@ def create_path_trace(src_ip, dest_ip, dnac_jwt_token):
 
     url = DNAC_URL + '/api/v1/flow-analysis'
     header = {'accept': 'application/json', 'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    path_response = requests.post(url, data=json.dumps(param), headers=header, verify=False)
+    path_response = DNAC_SESSION.post(url, data=json.dumps(param), headers=header, verify=False)
     path_json = path_response.json()
     path_id = path_json['response']['flowAnalysisId']
     return path_id
@@ -816,7 +972,7 @@ def get_path_trace_info(path_id, dnac_jwt_token):
 
     url = DNAC_URL + '/api/v1/flow-analysis/' + path_id
     header = {'accept': 'application/json', 'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    path_response = requests.get(url, headers=header, verify=False)
+    path_response = DNAC_SESSION.get(url, headers=header, verify=False)
     path_json = path_response.json()
     path_info = path_json['response']
     path_status = path_info['request']['status']
@@ -850,7 +1006,7 @@ def check_ipv4_network_interface(ip_address, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/interface/ip-address/' + ip_address
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     response_json = response.json()
     try:
         response_info = response_json['response'][0]
@@ -874,7 +1030,7 @@ def get_device_info_ip(ip_address, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/network-device/ip-address/' + ip_address
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     response_json = response.json()
     device_info = response_json['response']
     if 'errorCode' == 'Not found':
@@ -891,7 +1047,7 @@ def get_legit_cli_command_runner(dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/network-device-poller/cli/legit-reads'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     response_json = response.json()
     cli_list = response_json['response']
     return cli_list
@@ -906,11 +1062,84 @@ def get_content_file_id(file_id, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/file/' + file_id
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False, stream=True)
+    response = DNAC_SESSION.get(url, headers=header, verify=False, stream=True)
     response_json = response.json()
     return response_json
 
 
+def create_command_runner_task(commands, device_ids, dnac_jwt_token):
+    """
+    This function will send the CLI commands in the list {commands} to all the devices with the DNA C ids in the
+    list {device_ids}, using one command runner read request
+    :param commands: list of CLI commands
+    :param device_ids: list of DNA C device ids
+    :param dnac_jwt_token: DNA C token
+    :return: DNA C task id that will process the CLI command runner request
+    """
+    payload = {
+        "commands": commands,
+        "deviceUuids": device_ids,
+        "timeout": 0
+        }
+    url = DNAC_URL + '/api/v1/network-device-poller/cli/read-request'
+    header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
+    response = DNAC_SESSION.post(url, data=json.dumps(payload), headers=header, verify=False)
+    response_json = response.json()
+    task_id = response_json['response']['taskId']
+    return task_id
+
+
+def get_command_runner_file_output(task_result, dnac_jwt_token, timeout=TASK_TIMEOUT):
+    """
+    This function will download the file with the commands output, for the completed command runner task with the
+    info {task_result}. The download is retried, with backoff, until the file is ready
+    :param task_result: command runner task info
+    :param dnac_jwt_token: DNA C token
+    :param timeout: maximum time to wait for the file, in seconds
+    :return: list with the commands output for each device
+    """
+    file_info = json.loads(task_result['progress'])
+    file_id = file_info['fileId']
+
+    # get output from file, as soon as the file is ready
+    deadline = time.time() + timeout
+    for delay in utils.backoff_delays(TASK_POLL_INITIAL_DELAY, TASK_POLL_MAX_DELAY):
+        try:
+            file_output = get_content_file_id(file_id, dnac_jwt_token)
+            if isinstance(file_output, list):
+                return file_output
+        except ValueError:
+            pass
+        if time.time() + delay > deadline:
+            raise TimeoutError('DNA C file ' + file_id + ' not available in ' + str(timeout) + ' seconds')
+        time.sleep(delay)
+
+
+def get_command_runner_task_output(task_id, dnac_jwt_token):
+    """
+    This function will wait for the command runner task with the id {task_id} to complete, and download the file
+    with the commands output
+    :param task_id: command runner task id
+    :param dnac_jwt_token: DNA C token
+    :return: list with the commands output for each device
+    """
+    task_result = check_task_id_output(task_id, dnac_jwt_token)
+    return get_command_runner_file_output(task_result, dnac_jwt_token)
+
+
+def get_command_response(command_responses, command):
+    """
+    This function will return the output for the CLI command {command}, from the command runner {commandResponses}
+    :param command_responses: command runner output for one device
+    :param command: CLI command
+    :return: command output, or None if the command output is not found
+    """
+    for status in ['SUCCESS', 'FAILURE', 'BLACKLISTED']:
+        if command in command_responses.get(status, {}):
+            return command_responses[status][command]
+    return None
+
+
 def get_output_command_runner(command, device_name, dnac_jwt_token):
     """
     This function will return the output of the CLI command specified in the {command}, sent to the device with the
@@ -925,35 +1154,63 @@ def get_output_command_runner(command, device_name, dnac_jwt_token):
     device_id = get_device_id_name(device_name, dnac_jwt_token)
 
     # get the DNA C task id that will process the CLI command runner
-    payload = {
-        "commands": [command],
-        "deviceUuids": [device_id],
-        "timeout": 0
-        }
-    url = DNAC_URL + '/api/v1/network-device-poller/cli/read-request'
-    header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.post(url, data=json.dumps(payload), headers=header, verify=False)
-    response_json = response.json()
-    task_id = response_json['response']['taskId']
-
-    # get task id status
-    task_result = check_task_id_output(task_id, dnac_jwt_token)
-    file_info = json.loads(task_result['progress'])
-    file_id = file_info['fileId']
+    task_id = create_command_runner_task([command], [device_id], dnac_jwt_token)
 
     # get output from file
-    time.sleep(2)  # wait for a second for the file to be ready
-    file_output = get_content_file_id(file_id, dnac_jwt_token)
-    command_responses = file_output[0]['commandResponses']
-    if command_responses['SUCCESS'] is not {}:
-        command_output = command_responses['SUCCESS'][command]
-    elif command_responses['FAILURE'] is not {}:
-        command_output = command_responses['FAILURE'][command]
-    else:
-        command_output = command_responses['BLACKLISTED'][command]
+    file_output = get_command_runner_task_output(task_id, dnac_jwt_token)
+    command_output = get_command_response(file_output[0]['commandResponses'], command)
     return command_output
 
 
+def get_output_command_runner_batch(commands, device_names, dnac_jwt_token, max_commands=COMMAND_RUNNER_MAX_COMMANDS,
+                                    max_devices=COMMAND_RUNNER_MAX_DEVICES):
+    """
+    This function will return the output of all the CLI commands in the list {commands}, sent to all the devices with
+    the hostnames in the list {device_names}.
+    The devices and commands are split in chunks of maximum {max_devices} devices and {max_commands} commands, each
+    chunk is sent as one command runner request. All requests are submitted before waiting for the tasks to complete
+    :param commands: list of CLI commands
+    :param device_names: list of device hostnames
+    :param dnac_jwt_token: DNA C token
+    :param max_commands: maximum number of commands for each request
+    :param max_devices: maximum number of devices for each request
+    :return: commands output - {device_name: {command: output}}, devices not found in DNA C are not included
+    """
+
+    # get the DNA C device ids
+    device_names_ids = {}
+    for device_name in device_names:
+        device_id = get_device_id_name(device_name, dnac_jwt_token)
+        if device_id is not None:
+            device_names_ids[device_id] = device_name
+    device_ids = list(device_names_ids)
+
+    # submit all the command runner requests
+    task_ids = []
+    for device_index in range(0, len(device_ids), max_devices):
+        for command_index in range(0, len(commands), max_commands):
+            task_id = create_command_runner_task(commands[command_index:command_index + max_commands],
+                                                 device_ids[device_index:device_index + max_devices], dnac_jwt_token)
+            task_ids.append(task_id)
+
+    # collect the output for all the tasks
+    commands_output = {}
+    for device_name in device_names_ids.values():
+        commands_output[device_name] = {}
+    tasks_output = wait_for_tasks(task_ids, dnac_jwt_token)
+    for task_id in task_ids:
+        file_output = get_command_runner_file_output(tasks_output[task_id], dnac_jwt_token)
+        for device_output in file_output:
+            device_name = device_names_ids.get(device_output['deviceUuid'])
+            if device_name is None:
+                continue
+            command_responses = device_output['commandResponses']
+            for status in ['SUCCESS', 'FAILURE', 'BLACKLISTED']:
+                for command in command_responses.get(status, {}):
+                    commands_output[device_name].setdefault(command, command_responses[status][command])
+    return commands_output
+
+
 def get_all_configs(dnac_jwt_token):
     """
     This function will retrieve all the devices configurations
@@ -962,7 +1219,7 @@ def get_all_configs(dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/network-device/config'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     config_json = response.json()
     config_files = config_json['response']
     return config_files
@@ -978,7 +1235,7 @@ def get_device_config(device_name, dnac_jwt_token):
     device_id = get_device_id_name(device_name, dnac_jwt_token)
     url = DNAC_URL + '/api/v1/network-device/' + device_id + '/config'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     config_json = response.json()
     config_file = config_json['response']
     return config_file
@@ -1015,7 +1272,7 @@ def check_ipv4_address_configs(ipv4_address, dnac_jwt_token):
     """
     url = DNAC_URL + '/api/v1/network-device/config'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     config_json = response.json()
     config_files = config_json['response']
     for config in config_files:
@@ -1025,57 +1282,239 @@ def check_ipv4_address_configs(ipv4_address, dnac_jwt_token):
     return False
 
 
-def check_ipv4_duplicate(config_file):
+def get_interface_info_page(offset, limit, dnac_jwt_token):
+    """
+    This function will return one page of the network devices interfaces, {limit} interfaces starting with {offset}
+    :param offset: index of the first interface, starting with 1
+    :param limit: number of interfaces to return
+    :param dnac_jwt_token: DNA C token
+    :return: list with the interfaces info
+    """
+    url = DNAC_URL + '/api/v1/interface?offset=' + str(offset) + '&limit=' + str(limit)
+    header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
+    response_json = response.json()
+    return response_json['response']
+
+
+def get_host_info_page(offset, limit, dnac_jwt_token):
+    """
+    This function will return one page of the hosts, {limit} hosts starting with {offset}
+    :param offset: index of the first host, starting with 1
+    :param limit: number of hosts to return
+    :param dnac_jwt_token: DNA C token
+    :return: list with the hosts info
+    """
+    url = DNAC_URL + '/api/v1/host?offset=' + str(offset) + '&limit=' + str(limit)
+    header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
+    response_json = response.json()
+    return response_json['response']
+
+
+def get_device_interfaces(device_id, dnac_jwt_token):
+    """
+    This function will return all the interfaces for the device with the DNA C device id {device_id}
+    :param device_id: DNA C device id
+    :param dnac_jwt_token: DNA C token
+    :return: list with the interfaces info
+    """
+    url = DNAC_URL + '/api/v1/interface/network-device/' + device_id
+    header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
+    response_json = response.json()
+    return response_json['response']
+
+
+def add_ipv4_index_interfaces(ipv4_index, interfaces, dnac_jwt_token):
+    """
+    This function will add the IPv4 addresses for the interfaces in the list {interfaces} to the index {ipv4_index}
+    :param ipv4_index: IPv4 address index
+    :param interfaces: list with the interfaces info
+    :param dnac_jwt_token: DNA C token
+    :return:
+    """
+    for interface in interfaces:
+        ipv4_address = interface.get('ipv4Address')
+        if not ipv4_address:
+            continue
+        device_id = interface.get('deviceId')
+        device_info = get_inventory_device_info('id', device_id, dnac_jwt_token)
+        ipv4_index['interfaces'][ipv4_address] = {
+            'hostname': device_info['hostname'] if device_info else '',
+            'interface': interface.get('portName', ''),
+            'mask': interface.get('ipv4Mask'),
+            'deviceId': device_id
+        }
+        ipv4_index['devices'].setdefault(device_id, set()).add(ipv4_address)
+
+
+def get_ipv4_index(dnac_jwt_token, ttl=IPV4_INDEX_TTL):
+    """
+    This function will return the local IPv4 address index, with all the IPv4 addresses configured on the network
+    devices interfaces, or used by clients. The index is downloaded from DNA C, using the interfaces and the hosts
+    inventories, only if the index is older than {ttl} seconds, or it was invalidated
+    :param dnac_jwt_token: DNA C token
+    :param ttl: index time to live, in seconds
+    :return: IPv4 address index - {'interfaces': {address: interface info}, 'clients': {address: client info},
+    'devices': {device id: set of addresses}}
+    """
+    with IPV4_INDEX_LOCK:
+        if time.time() - IPV4_INDEX['timestamp'] > ttl:
+            ipv4_index = {'interfaces': {}, 'clients': {}, 'devices': {}}
+
+            def fetch_interfaces(offset, limit):
+                return get_interface_info_page(offset, limit, dnac_jwt_token)
+
+            def fetch_hosts(offset, limit):
+                return get_host_info_page(offset, limit, dnac_jwt_token)
+
+            add_ipv4_index_interfaces(ipv4_index, utils.iter_pages(fetch_interfaces, INTERFACE_PAGE_SIZE, 1),
+                                      dnac_jwt_token)
+            for host in utils.iter_pages(fetch_hosts, HOST_PAGE_SIZE, 1):
+                if host.get('hostIp'):
+                    ipv4_index['clients'][host['hostIp']] = host
+            IPV4_INDEX.update(ipv4_index)
+            IPV4_INDEX['prefix_index'] = None
+            IPV4_INDEX['timestamp'] = time.time()
+        return IPV4_INDEX
+
+
+def refresh_ipv4_index_devices(device_ids, dnac_jwt_token):
+    """
+    This function will refresh the local IPv4 address index only for the devices with the DNA C ids in the list
+    {device_ids}, the addresses for all the other devices are not changed
+    :param device_ids: list of DNA C device ids
+    :param dnac_jwt_token: DNA C token
+    :return:
+    """
+    ipv4_index = get_ipv4_index(dnac_jwt_token)
+    for device_id in device_ids:
+        interfaces = get_device_interfaces(device_id, dnac_jwt_token)
+        with IPV4_INDEX_LOCK:
+            for ipv4_address in ipv4_index['devices'].pop(device_id, set()):
+                if ipv4_index['interfaces'].get(ipv4_address, {}).get('deviceId') == device_id:
+                    del ipv4_index['interfaces'][ipv4_address]
+            add_ipv4_index_interfaces(ipv4_index, interfaces, dnac_jwt_token)
+            ipv4_index['prefix_index'] = None
+
+
+def get_ipv4_prefix_index(dnac_jwt_token):
+    """
+    This function will return the interval index for all the IPv4 prefixes configured on the network devices
+    interfaces, built from the local IPv4 address index
+    :param dnac_jwt_token: DNA C token
+    :return: prefix index, the info for each prefix is the interface info - {'hostname', 'interface', 'mask', ...}
+    """
+    ipv4_index = get_ipv4_index(dnac_jwt_token)
+    with IPV4_INDEX_LOCK:
+        if ipv4_index.get('prefix_index') is None:
+            prefixes = []
+            for ipv4_address, interface_info in ipv4_index['interfaces'].items():
+                if interface_info['mask']:
+                    try:
+                        network = ipaddress.IPv4Network(ipv4_address + '/' + interface_info['mask'], strict=False)
+                        prefixes.append((network, interface_info))
+                    except ValueError:
+                        pass
+            ipv4_index['prefix_index'] = utils.build_prefix_index(prefixes)
+        return ipv4_index['prefix_index']
+
+
+def invalidate_ipv4_index():
+    """
+    This function will invalidate the local IPv4 address index, the next lookup will download the index
+    :return:
+    """
+    with IPV4_INDEX_LOCK:
+        IPV4_INDEX['timestamp'] = 0
+
+
+def lookup_ipv4_address(ipv4_address, dnac_jwt_token):
+    """
+    This function will find if the IPv4 address {ipv4_address} is used on any network devices, interfaces or
+    management IP address, or by any clients, using the local indexes
+    :param ipv4_address: IPv4 address
+    :param dnac_jwt_token: DNA C token
+    :return: None, or ('interface', device_hostname, interface_name), or ('client', client info)
+    """
+    ipv4_index = get_ipv4_index(dnac_jwt_token)
+    interface_info = ipv4_index['interfaces'].get(ipv4_address)
+    if interface_info is not None:
+        return 'interface', interface_info['hostname'], interface_info['interface']
+    device_info = get_inventory_device_info('managementIpAddress', ipv4_address, dnac_jwt_token)
+    if device_info is not None:
+        return 'interface', device_info['hostname'], ''
+    client_info = ipv4_index['clients'].get(ipv4_address)
+    if client_info is not None:
+        return 'client', client_info
+    return None
+
+
+def check_ipv4_duplicate(config_file, dnac_jwt_token=None):
     """
     This function will:
       - load a file with a configuration to be deployed to a network device
       - identify the IPv4 addresses that will be configured on interfaces
-      - search in the DNA Center database if these IPV4 addresses are configured on any interfaces
+      - search in the local IPv4 address index if these IPV4 addresses are configured on any interfaces
       - find if any clients are using the IPv4 addresses
       - Determine if deploying the configuration file will create an IP duplicate
     :param config_file: configuration file name
+    :param dnac_jwt_token: DNA C token, a new token is created if not provided
     :return True/False
     """
 
     # open file with the template
-    cli_file = open(config_file, 'r')
-
-    # read the file
-    cli_config = cli_file.read()
+    with open(config_file, 'r') as cli_file:
+        cli_config = cli_file.read()
 
     ipv4_address_list = utils.identify_ipv4_address(cli_config)
 
     # get the DNA Center Auth token
 
-    dnac_token = get_dnac_jwt_token(DNAC_AUTH)
+    if dnac_jwt_token is None:
+        dnac_jwt_token = get_dnac_jwt_token(DNAC_AUTH)
 
-    # check each address against network devices and clients database
-    # initialize duplicate_ip
+    # check each address against network devices and clients in the local index
 
-    duplicate_ip = False
     for ipv4_address in ipv4_address_list:
+        if lookup_ipv4_address(ipv4_address, dnac_jwt_token) is not None:
+            return True
+    return False
 
-        # check against network devices interfaces
 
-        try:
-            device_info = check_ipv4_network_interface(ipv4_address, dnac_token)
-            duplicate_ip = True
-        except:
-            pass
+def check_ipv4_overlap(config_file, dnac_jwt_token=None, device_name=None):
+    """
+    This function will:
+      - load a file with a configuration to be deployed to a network device
+      - identify the IPv4 prefixes, address and mask, that will be configured on interfaces
+      - find the prefixes configured on network devices interfaces that overlap these prefixes, using the prefix index
+    The same subnet configured on another device (a shared segment) is not an overlap, the duplicated addresses are
+    found by the function {check_ipv4_duplicate}
+    :param config_file: configuration file name
+    :param dnac_jwt_token: DNA C token, a new token is created if not provided
+    :param device_name: the device hostname the configuration is deployed to, its own prefixes are not overlaps
+    :return: list of overlaps - (template prefix, overlapping prefix, interface info)
+    """
 
-        # check against any hosts
+    # open file with the template
+    with open(config_file, 'r') as cli_file:
+        cli_config = cli_file.read()
 
-        try:
-            client_info = get_client_info(ipv4_address, dnac_token)
-            if client_info is not None:
-                duplicate_ip = True
-        except:
-            pass
+    ipv4_prefix_list = utils.identify_ipv4_prefixes(cli_config)
 
-    if duplicate_ip:
-        return True
-    else:
-        return False
+    if dnac_jwt_token is None:
+        dnac_jwt_token = get_dnac_jwt_token(DNAC_AUTH)
+    prefix_index = get_ipv4_prefix_index(dnac_jwt_token)
+
+    overlaps = []
+    for ipv4_prefix in ipv4_prefix_list:
+        network = ipv4_prefix.network
+        for overlap_network, interface_info in utils.find_prefix_overlaps(prefix_index, network,
+                                                                          include_identical=False):
+            if interface_info['hostname'] != device_name:
+                overlaps.append((network, overlap_network, interface_info))
+    return overlaps
 
 
 def get_device_health(device_name, epoch_time, dnac_jwt_token):
@@ -1091,7 +1530,7 @@ def get_device_health(device_name, epoch_time, dnac_jwt_token):
     url = DNAC_URL + '/dna/intent/api/v1/device-detail?timestamp=' + str(epoch_time) + '&searchBy=' + device_id
     url += '&identifier=uuid'
     header = {'content-type': 'application/json', 'x-auth-token': dnac_jwt_token}
-    response = requests.get(url, headers=header, verify=False)
+    response = DNAC_SESSION.get(url, headers=header, verify=False)
     device_detail_json = response.json()
     device_detail = device_detail_json['response']
     return device_detail
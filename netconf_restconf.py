@@ -8,16 +8,145 @@ import urllib3
 import ncclient
 import xml
 import xml.dom.minidom
+import xml.etree.ElementTree
+import xml.sax.saxutils
+import io
 import json
+import time
+import threading
+import contextlib
 import utils
 
 from ncclient import manager
+from requests.adapters import HTTPAdapter
 
 from urllib3.exceptions import InsecureRequestWarning
 from requests.auth import HTTPBasicAuth  # for Basic Auth
 
+try:
+    from concurrent.futures import ThreadPoolExecutor
+except ImportError:
+    ThreadPoolExecutor = None  # Guest Shell Python 2, the batch reads are sequential
+
+
 urllib3.disable_warnings(InsecureRequestWarning)  # Disable insecure https warnings
 
+IETF_INTERFACES_NS = 'urn:ietf:params:xml:ns:yang:ietf-interfaces'
+
+RESTCONF_HEADERS = {'Content-type': 'application/yang-data+json', 'accept': 'application/yang-data+json'}
+RESTCONF_POOL_SIZE = 8  # maximum number of connections kept open to each device
+RESTCONF_MAX_IN_FLIGHT = 8  # maximum number of concurrent requests for the batch reads
+
+# the RESTCONF sessions - {(host, username, password): requests session}
+RESTCONF_SESSIONS = {}
+RESTCONF_SESSIONS_LOCK = threading.Lock()
+
+NETCONF_KEEPALIVE = 30  # seconds, SSH keepalive interval for the pooled NETCONF sessions
+NETCONF_IDLE_TIMEOUT = 300  # seconds, the NETCONF sessions not used for this long are closed
+
+# the idle NETCONF sessions - {(host, port, username, password): [{'manager', 'last_used'}]}
+NETCONF_SESSIONS = {}
+NETCONF_SESSIONS_LOCK = threading.Lock()
+
+
+def netconf_connect(ios_xe_host, ios_xe_port, ios_xe_user, ios_xe_pass):
+    """
+    This function will open a new NETCONF session, with SSH keepalive enabled
+    :param ios_xe_host: device IPv4 address
+    :param ios_xe_port: NETCONF port
+    :param ios_xe_user: username
+    :param ios_xe_pass: password
+    :return: NETCONF manager
+    """
+    m = manager.connect(host=ios_xe_host, port=ios_xe_port, username=ios_xe_user,
+                        password=ios_xe_pass, hostkey_verify=False,
+                        device_params={'name': 'default'},
+                        allow_agent=False, look_for_keys=False)
+    # the SSH transport is not exposed by the ncclient API, the keepalive is optional
+    transport = getattr(getattr(m, '_session', None), '_transport', None)
+    if transport is not None:
+        transport.set_keepalive(NETCONF_KEEPALIVE)
+    return m
+
+
+def close_netconf_manager(m):
+    """
+    This function will close the NETCONF session {m}, ignoring the errors for sessions already disconnected
+    :param m: NETCONF manager
+    :return:
+    """
+    try:
+        m.close_session()
+    except Exception:
+        pass
+
+
+def evict_idle_netconf_sessions(idle_timeout=NETCONF_IDLE_TIMEOUT):
+    """
+    This function will close the pooled NETCONF sessions not used in the last {idle_timeout} seconds, and the
+    sessions disconnected by the device
+    :param idle_timeout: seconds, maximum idle time
+    :return:
+    """
+    evicted = []
+    now = time.time()
+    with NETCONF_SESSIONS_LOCK:
+        for key, sessions in list(NETCONF_SESSIONS.items()):
+            active_sessions = []
+            for session in sessions:
+                if now - session['last_used'] > idle_timeout or not session['manager'].connected:
+                    evicted.append(session['manager'])
+                else:
+                    active_sessions.append(session)
+            if active_sessions:
+                NETCONF_SESSIONS[key] = active_sessions
+            else:
+                del NETCONF_SESSIONS[key]
+    for m in evicted:
+        close_netconf_manager(m)
+
+
+def close_netconf_sessions():
+    """
+    This function will close all the pooled NETCONF sessions
+    :return:
+    """
+    with NETCONF_SESSIONS_LOCK:
+        sessions = [session for key_sessions in NETCONF_SESSIONS.values() for session in key_sessions]
+        NETCONF_SESSIONS.clear()
+    for session in sessions:
+        close_netconf_manager(session['manager'])
+
+
+@contextlib.contextmanager
+def netconf_session(ios_xe_host, ios_xe_port, ios_xe_user, ios_xe_pass):
+    """
+    This context manager will check out a NETCONF session for the device, from the session pool. A new session is
+    opened if there is no idle session for the device, port and credentials. Each session is used by one thread at a
+    time, the session is returned to the pool at the end of the with block, or closed if the block raised an exception
+    :param ios_xe_host: device IPv4 address
+    :param ios_xe_port: NETCONF port
+    :param ios_xe_user: username
+    :param ios_xe_pass: password
+    :return: NETCONF manager
+    """
+    evict_idle_netconf_sessions()
+    key = (ios_xe_host, int(ios_xe_port), ios_xe_user, ios_xe_pass)
+    m = None
+    with NETCONF_SESSIONS_LOCK:
+        if NETCONF_SESSIONS.get(key):
+            m = NETCONF_SESSIONS[key].pop()['manager']
+    if m is None:
+        m = netconf_connect(ios_xe_host, ios_xe_port, ios_xe_user, ios_xe_pass)
+    try:
+        yield m
+    except Exception:
+        close_netconf_manager(m)
+        raise
+    if m.connected:
+        with NETCONF_SESSIONS_LOCK:
+            NETCONF_SESSIONS.setdefault(key, []).append({'manager': m, 'last_used': time.time()})
+
 
 def get_netconf_hostname(ios_xe_host, ios_xe_port, ios_xe_user, ios_xe_pass):
     """
@@ -29,10 +158,7 @@ def get_netconf_hostname(ios_xe_host, ios_xe_port, ios_xe_user, ios_xe_pass):
     :return: IOS XE device hostname
     """
 
-    with manager.connect(host=ios_xe_host, port=ios_xe_port, username=ios_xe_user,
-                         password=ios_xe_pass, hostkey_verify=False,
-                         device_params={'name': 'default'},
-                         allow_agent=False, look_for_keys=False) as m:
+    with netconf_session(ios_xe_host, ios_xe_port, ios_xe_user, ios_xe_pass) as m:
         # XML filter to issue with the get operation
         # IOS-XE 16.6.2+        YANG model called "Cisco-IOS-XE-native"
 
@@ -63,11 +189,7 @@ def get_restconf_hostname(ios_xe_host, ios_xe_user, ios_xe_pass):
     :return: IOS XE device hostname
     """
 
-    dev_auth = HTTPBasicAuth(ios_xe_user, ios_xe_pass)
-    url = 'https://' + ios_xe_host + '/restconf/data/Cisco-IOS-XE-native:native/hostname'
-    header = {'Content-type': 'application/yang-data+json', 'accept': 'application/yang-data+json'}
-    response = requests.get(url, headers=header, verify=False, auth=dev_auth)
-    hostname_json = response.json()
+    hostname_json = get_restconf_data('Cisco-IOS-XE-native:native/hostname', ios_xe_host, ios_xe_user, ios_xe_pass)
     hostname = hostname_json['Cisco-IOS-XE-native:hostname']
     return hostname
 
@@ -83,10 +205,7 @@ def get_netconf_int_oper_data(interface, ios_xe_host, ios_xe_port, ios_xe_user,
     :return: interface operational data in XML
     """
 
-    with manager.connect(host=ios_xe_host, port=ios_xe_port, username=ios_xe_user,
-                         password=ios_xe_pass, hostkey_verify=False,
-                         device_params={'name': 'default'},
-                         allow_agent=False, look_for_keys=False) as m:
+    with netconf_session(ios_xe_host, ios_xe_port, ios_xe_user, ios_xe_pass) as m:
         # XML filter to issue with the get operation
         # IOS-XE 16.6.2+        YANG model called "ietf-interfaces"
 
@@ -108,14 +227,181 @@ def get_netconf_int_oper_data(interface, ios_xe_host, ios_xe_port, ios_xe_user,
         return oper_data
 
 
-def get_restconf_int_oper_data(interface, ios_xe_host, ios_xe_user, ios_xe_pass):
+def get_xml_local_name(tag):
     """
-    This function will retrieve the operational data for the interface via RESTCONF
-    :param interface: interface name
+    This function will return the XML tag {tag} without the namespace
+    :param tag: XML tag, '{urn:ietf:params:xml:ns:yang:ietf-interfaces}name' for example
+    :return: tag without namespace, 'name' for example
+    """
+    return tag.rsplit('}', 1)[-1]
+
+
+def get_xml_value(text):
+    """
+    This function will convert the XML leaf value {text} to int, for counters and numeric leafs
+    :param text: leaf value
+    :return: int, or the text if not numeric
+    """
+    if text is not None and text.isdigit():
+        return int(text)
+    return text
+
+
+def get_xml_record(element):
+    """
+    This function will convert the XML element {element} to a dict: each leaf child is saved as {name: value}, each
+    container child as {name: dict}, repeated children as {name: [values]}
+    :param element: XML element
+    :return: record
+    """
+    record = {}
+    for child in element:
+        name = get_xml_local_name(child.tag)
+        if len(child):
+            value = get_xml_record(child)
+        else:
+            value = get_xml_value(child.text)
+        if name in record:
+            if not isinstance(record[name], list):
+                record[name] = [record[name]]
+            record[name].append(value)
+        else:
+            record[name] = value
+    return record
+
+
+def iter_interfaces_state(xml_reply):
+    """
+    This generator will parse the interfaces-state NETCONF reply {xml_reply} incrementally, and return one record
+    for each interface. Each interface element is released after it is converted, only one interface is kept in
+    memory
+    :param xml_reply: NETCONF reply XML, string or bytes
+    :return: interface records - {'name', 'type', 'admin-status', 'oper-status', 'statistics': {counter: value}, ...}
+    """
+    if not isinstance(xml_reply, bytes):
+        xml_reply = xml_reply.encode('utf-8')
+    interface_tag = '{' + IETF_INTERFACES_NS + '}interface'
+    for event, element in xml.etree.ElementTree.iterparse(io.BytesIO(xml_reply), events=('end',)):
+        if element.tag == interface_tag:
+            yield get_xml_record(element)
+            element.clear()
+
+
+def get_netconf_int_oper_data_bulk(ios_xe_host, ios_xe_port, ios_xe_user, ios_xe_pass, interfaces=None):
+    """
+    This function will retrieve the operational data for all the interfaces, or for the interfaces from the list
+    {interfaces}, via NETCONF, with one get operation
     :param ios_xe_host: device IPv4 address
+    :param ios_xe_port: NETCONF port
     :param ios_xe_user: username
     :param ios_xe_pass: password
-    :return: interface operational data in JSON
+    :param interfaces: list of interface names, or None for all interfaces
+    :return: interfaces operational data - {interface name: interface record}
+    """
+
+    # XML filter to issue with the get operation
+    # IOS-XE 16.6.2+        YANG model called "ietf-interfaces"
+
+    interface_filter = ''
+    if interfaces:
+        for interface in interfaces:
+            interface_filter += '<interface><name>' + xml.sax.saxutils.escape(interface) + '</name></interface>'
+    interface_state_filter = ('<filter xmlns="urn:ietf:params:xml:ns:netconf:base:1.0">'
+                              '<interfaces-state xmlns="' + IETF_INTERFACES_NS + '">' + interface_filter +
+                              '</interfaces-state></filter>')
+
+    with netconf_session(ios_xe_host, ios_xe_port, ios_xe_user, ios_xe_pass) as m:
+        result = m.get(interface_state_filter)
+    oper_data = {}
+    for record in iter_interfaces_state(result.xml):
+        oper_data[record.get('name')] = record
+    return oper_data
+
+
+def restconf_session_init(ios_xe_user, ios_xe_pass, pool_size=RESTCONF_POOL_SIZE):
+    """
+    Create the HTTP session for the RESTCONF API calls to one device. The session keeps the TCP/TLS connections open
+    between calls and will allow up to {pool_size} concurrent connections
+    :param ios_xe_user: username
+    :param ios_xe_pass: password
+    :param pool_size: maximum number of connections to keep open
+    :return: requests session
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.verify = False
+    session.auth = HTTPBasicAuth(ios_xe_user, ios_xe_pass)
+    session.headers.update(RESTCONF_HEADERS)
+    return session
+
+
+def get_restconf_session(ios_xe_host, ios_xe_user, ios_xe_pass):
+    """
+    This function will return the RESTCONF session for the device and credentials, the session is created with the
+    first call. A new session is created if the password changes
+    :param ios_xe_host: device IPv4 address
+    :param ios_xe_user: username
+    :param ios_xe_pass: password
+    :return: requests session
+    """
+    key = (ios_xe_host, ios_xe_user, ios_xe_pass)
+    with RESTCONF_SESSIONS_LOCK:
+        session = RESTCONF_SESSIONS.get(key)
+        if session is None:
+            session = restconf_session_init(ios_xe_user, ios_xe_pass)
+            RESTCONF_SESSIONS[key] = session
+        return session
+
+
+def get_restconf_data(path, ios_xe_host, ios_xe_user, ios_xe_pass):
+    """
+    This function will retrieve the RESTCONF resource {path}
+    :param path: resource path, relative to /restconf/data/, 'Cisco-IOS-XE-native:native/hostname' for example
+    :param ios_xe_host: device IPv4 address
+    :param ios_xe_user: username
+    :param ios_xe_pass: password
+    :return: resource data in JSON. requests.HTTPError is raised for an error status code, ValueError if the resource
+    has no data
+    """
+    url = 'https://' + ios_xe_host + '/restconf/data/' + path
+    response = get_restconf_session(ios_xe_host, ios_xe_user, ios_xe_pass).get(url)
+    response.raise_for_status()
+    return response.json()
+
+
+def get_restconf_data_batch(paths, ios_xe_host, ios_xe_user, ios_xe_pass, max_in_flight=RESTCONF_MAX_IN_FLIGHT):
+    """
+    This function will retrieve the RESTCONF resources from the list {paths}, with up to {max_in_flight} concurrent
+    requests, over the device RESTCONF session
+    :param paths: list of resource paths, relative to /restconf/data/
+    :param ios_xe_host: device IPv4 address
+    :param ios_xe_user: username
+    :param ios_xe_pass: password
+    :param max_in_flight: maximum number of concurrent requests
+    :return: {path: resource data in JSON, or None if the resource does not exist or has no data}
+    """
+    def get_path_data(path):
+        try:
+            return get_restconf_data(path, ios_xe_host, ios_xe_user, ios_xe_pass)
+        except (requests.HTTPError, ValueError):
+            return None
+
+    paths = list(paths)
+    if not paths:
+        return {}
+    if ThreadPoolExecutor is None:
+        return dict((path, get_path_data(path)) for path in paths)
+    with ThreadPoolExecutor(max_workers=min(max_in_flight, len(paths))) as executor:
+        results = executor.map(get_path_data, paths)
+        return dict(zip(paths, results))
+
+
+def get_restconf_interface_path(interface):
+    """
+    This function will return the RESTCONF resource path for the interface operational data
+    :param interface: interface name
+    :return: resource path, relative to /restconf/data/
     """
 
     # encode the interface URI: GigabitEthernet0/0/2 - http://10.104.50.97/restconf/data/Cisco-IOS-XE-native:native/interface/GigabitEthernet=0%2F0%2F2
@@ -123,16 +409,50 @@ def get_restconf_int_oper_data(interface, ios_xe_host, ios_xe_user, ios_xe_pass)
 
     interface_uri = interface.replace('/', '%2F')
     interface_uri = interface_uri.replace('.', '%2E')
-    dev_auth = HTTPBasicAuth(ios_xe_user, ios_xe_pass)
-    url = 'https://' + ios_xe_host + '/restconf/data/ietf-interfaces:interfaces-state/interface=' + interface_uri
-    print('The RESTCONF API resource is located: ' + url)
-    header = {'Content-type': 'application/yang-data+json', 'accept': 'application/yang-data+json'}
-    response = requests.get(url, headers=header, verify=False, auth=dev_auth)
-    interface_info = response.json()
+    return 'ietf-interfaces:interfaces-state/interface=' + interface_uri
+
+
+def get_restconf_int_oper_data(interface, ios_xe_host, ios_xe_user, ios_xe_pass):
+    """
+    This function will retrieve the operational data for the interface via RESTCONF
+    :param interface: interface name
+    :param ios_xe_host: device IPv4 address
+    :param ios_xe_user: username
+    :param ios_xe_pass: password
+    :return: interface operational data in JSON
+    """
+
+    path = get_restconf_interface_path(interface)
+    print('The RESTCONF API resource is located: https://' + ios_xe_host + '/restconf/data/' + path)
+    interface_info = get_restconf_data(path, ios_xe_host, ios_xe_user, ios_xe_pass)
     oper_data = interface_info['ietf-interfaces:interface']
     return oper_data
 
 
+def get_restconf_int_oper_data_batch(interfaces, ios_xe_host, ios_xe_user, ios_xe_pass,
+                                     max_in_flight=RESTCONF_MAX_IN_FLIGHT):
+    """
+    This function will retrieve the operational data for the interfaces from the list {interfaces} via RESTCONF, with
+    up to {max_in_flight} concurrent requests
+    :param interfaces: list of interface names
+    :param ios_xe_host: device IPv4 address
+    :param ios_xe_user: username
+    :param ios_xe_pass: password
+    :param max_in_flight: maximum number of concurrent requests
+    :return: {interface name: interface operational data in JSON, or None if not found}
+    """
+    interface_paths = {}
+    for interface in interfaces:
+        interface_paths[get_restconf_interface_path(interface)] = interface
+    results = get_restconf_data_batch(interface_paths.keys(), ios_xe_host, ios_xe_user, ios_xe_pass, max_in_flight)
+    oper_data = {}
+    for path, interface_info in results.items():
+        if interface_info is not None:
+            interface_info = interface_info['ietf-interfaces:interface']
+        oper_data[interface_paths[path]] = interface_info
+    return oper_data
+
+
 def get_restconf_capabilities(ios_xe_host, ios_xe_user, ios_xe_pass):
     """
     This function will retrieve the device capabilities via RESTCONF
@@ -141,9 +461,5 @@ def get_restconf_capabilities(ios_xe_host, ios_xe_user, ios_xe_pass):
     :param ios_xe_pass: password
     :return: device capabilities
     """
-    dev_auth = HTTPBasicAuth(ios_xe_user, ios_xe_pass)
-    url = 'https://' + ios_xe_host + '/restconf/data/netconf-state/capabilities'
-    header = {'Content-type': 'application/yang-data+json', 'accept': 'application/yang-data+json'}
-    response = requests.get(url, headers=header, verify=False, auth=dev_auth)
-    capabilities_json =  response.json()
-    return capabilities_json['ietf-netconf-monitoring:capabilities']
\ No newline at end of file
+    capabilities_json = get_restconf_data('netconf-state/capabilities', ios_xe_host, ios_xe_user, ios_xe_pass)
+    return capabilities_json['ietf-netconf-monitoring:capabilities']
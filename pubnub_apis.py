@@ -1,5 +1,3 @@
-
-
 # developed by Gabi Zapodeanu, TSA, GPO, Cisco Systems
 
 import json
@@ -7,11 +5,41 @@ import requests
 import pubnub
 import datetime
 import time
+import queue
+import threading
+import uuid
+
+from concurrent.futures import Future, TimeoutError
 
-from config import PUB_KEY, SUB_KEY, CHANNEL
+from config import PUB_KEY, SUB_KEY, CHANNEL, REPLY_CHANNEL
 
 from pubnub.pnconfiguration import PNConfiguration
 from pubnub.pubnub import PubNub
+from pubnub.callbacks import SubscribeCallback
+from pubnub.enums import PNStatusCategory
+
+
+PUBLISH_BATCH_SIZE = 20  # maximum number of messages sent with one publish
+PUBLISH_BATCH_WINDOW = 0.05  # seconds, wait time for more messages after the first message of a batch
+PUBLISH_TIMEOUT = 30  # seconds, maximum wait time for the publish ack
+PRESENCE_TTL = 30  # seconds, the channel presence info is reused for this long
+COMMAND_REPLY_TIMEOUT = 360  # seconds, maximum wait time for the command result, longer than the device timeout
+REPLY_CONNECT_TIMEOUT = 10  # seconds, maximum wait time for the reply channel subscribe
+
+# the publisher: one PubNub client and one worker thread, that sends all the messages from the publish queue
+PUBLISHER = {'pubnub': None, 'thread': None}
+PUBLISHER_LOCK = threading.Lock()
+PUBLISH_QUEUE = queue.Queue()
+
+PRESENCE_INFO = {'timestamp': 0}
+PRESENCE_LOCK = threading.Lock()
+
+# the command results published by the devices on the {REPLY_CHANNEL} channel, received by the publisher client
+REPLY_LISTENER = {'started': False, 'connected': threading.Event()}
+REPLY_LISTENER_LOCK = threading.Lock()
+PENDING_REPLIES = {}  # command id to future, for the commands waiting for the result
+PENDING_REPLIES_LOCK = threading.Lock()
+
 
 def pubnub_init():
 
@@ -43,21 +71,232 @@ def here_now_callback(result, status):
         print("uuid: %s, state: %s" % (occupant.uuid, occupant.state))
 
 
-def pub_message(command):
-    pubnub = pubnub_init()
-    # print("\nPubNub Channel Info: ", pubnub)
-    pubnub.publish().channel(CHANNEL).message(command).async(publish_callback)
-    pubnub.here_now() \
-        .channels(CHANNEL) \
-        .include_uuids(True) \
-        .async(here_now_callback)
+def get_publisher_client():
+    """
+    This function will return the PubNub client used by the publisher, the client is created with the first call
+    :return: PubNub client
+    """
+    with PUBLISHER_LOCK:
+        if PUBLISHER['pubnub'] is None:
+            PUBLISHER['pubnub'] = pubnub_init()
+        return PUBLISHER['pubnub']
+
+
+def start_publisher():
+    """
+    This function will start the publisher worker thread, if not already running
+    :return:
+    """
+    with PUBLISHER_LOCK:
+        if PUBLISHER['thread'] is None or not PUBLISHER['thread'].is_alive():
+            thread = threading.Thread(target=publisher_worker, name='pubnub-publisher')
+            thread.daemon = True
+            thread.start()
+            PUBLISHER['thread'] = thread
+
+
+def publish_message(message):
+    """
+    This function will add the message {message} to the publish queue. The messages queued at the same time, by one
+    or more threads, are sent with one publish
+    :param message: message to publish, 'NYC-9300#oper#show ip int bri' for example, or a dict with a command id
+    :return: future, with the publish result - {'ack': True/False, 'timetoken', 'latency': seconds from queued to ack,
+    'batch_size': number of messages sent with the same publish, 'error': error message if no ack}
+    """
+    start_publisher()
+    future = Future()
+    PUBLISH_QUEUE.put((message, future, time.time()))
+    return future
+
+
+def publisher_worker(batch_size=PUBLISH_BATCH_SIZE, batch_window=PUBLISH_BATCH_WINDOW):
+    """
+    The publisher worker thread. It will wait for the first message from the publish queue, collect the messages
+    queued in the next {batch_window} seconds, up to {batch_size} messages, and send them with one publish
+    :param batch_size: maximum number of messages sent with one publish
+    :param batch_window: seconds, wait time for more messages after the first message
+    :return:
+    """
+    while True:
+        batch = [PUBLISH_QUEUE.get()]
+        deadline = time.time() + batch_window
+        while len(batch) < batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(PUBLISH_QUEUE.get(timeout=remaining))
+            except queue.Empty:
+                break
+        try:
+            send_batch(batch)
+        finally:
+            for item in batch:
+                PUBLISH_QUEUE.task_done()
+
+
+def send_batch(batch):
+    """
+    This function will send the messages from {batch} with one publish, and set the result for each message future.
+    One message is sent as it is, more messages are sent as a list of messages
+    :param batch: list of (message, future, queued time)
+    :return:
+    """
+    messages = [message for message, future, queued_time in batch]
+    if len(messages) == 1:
+        payload = messages[0]
+    else:
+        payload = messages
+    try:
+        envelope = get_publisher_client().publish().channel(CHANNEL).message(payload).sync()
+        result = {'ack': True, 'timetoken': envelope.result.timetoken, 'error': None}
+    except Exception as e:
+        result = {'ack': False, 'timetoken': None, 'error': str(e)}
+    ack_time = time.time()
+    for message, future, queued_time in batch:
+        message_result = dict(result, latency=ack_time - queued_time, batch_size=len(batch))
+        future.set_result(message_result)
+
+
+def flush_publisher():
+    """
+    This function will wait until all the queued messages are sent
+    :return:
+    """
+    PUBLISH_QUEUE.join()
+
+
+def get_presence_info(ttl=PRESENCE_TTL):
+    """
+    This function will return the channel presence info. The info is requested only if older than {ttl} seconds
+    :param ttl: seconds, maximum age of the presence info
+    :return: presence info - {'timestamp', 'occupancy', 'uuids'}
+    """
+    with PRESENCE_LOCK:
+        if time.time() - PRESENCE_INFO['timestamp'] > ttl:
+            envelope = get_publisher_client().here_now().channels(CHANNEL).include_uuids(True).sync()
+            uuids = []
+            for channel_data in envelope.result.channels:
+                for occupant in channel_data.occupants:
+                    uuids.append(occupant.uuid)
+            PRESENCE_INFO.update({'timestamp': time.time(), 'occupancy': envelope.result.total_occupancy,
+                                  'uuids': uuids})
+        return dict(PRESENCE_INFO)
+
+
+def pub_message(command, check_presence=False, timeout=PUBLISH_TIMEOUT):
+    """
+    This function will publish the command {command} and wait for the publish ack
+    :param command: command to publish, 'NYC-9300#oper#show ip int bri' for example
+    :param check_presence: True to print the channel presence info, cached for {PRESENCE_TTL} seconds
+    :param timeout: seconds, maximum wait time for the publish ack
+    :return: publish result - {'ack', 'timetoken', 'latency', 'batch_size', 'error'}, or {'ack': False, 'timetoken':
+    None, 'error'} if the publish ack is not received after {timeout} seconds
+    """
+    try:
+        result = publish_message(command).result(timeout)
+    except TimeoutError:
+        result = {'ack': False, 'timetoken': None, 'error': 'publish ack not received after ' + str(timeout) +
+                                                             ' seconds'}
+    print("\nPublish result: ", result)
+    if check_presence:
+        presence_info = get_presence_info()
+        print("\nChannel status now:")
+        print("channel: %s" % CHANNEL)
+        print("occupancy: %s" % presence_info['occupancy'])
+        for occupant_uuid in presence_info['uuids']:
+            print("uuid: %s" % occupant_uuid)
+    return result
+
+
+class ReplyCallback(SubscribeCallback):
+    def status(self, pubnub, status):
+        if status.category == PNStatusCategory.PNConnectedCategory \
+                or status.category == PNStatusCategory.PNReconnectedCategory:
+            REPLY_LISTENER['connected'].set()
+
+    def presence(self, pubnub, presence):
+        pass  # handle incoming presence data
+
+    def message(self, pubnub, message):
+        if isinstance(message.message, dict):
+            handle_reply(message.message)
+
+
+def handle_reply(reply):
+    """
+    This function will set the result for the command waiting for the reply {reply}
+    :param reply: command result - {'id', 'device', 'command', 'status', 'execution_time', 'output_digest'}
+    :return:
+    """
+    with PENDING_REPLIES_LOCK:
+        future = PENDING_REPLIES.pop(reply.get('id'), None)
+    if future is not None and not future.done():
+        future.set_result(reply)
+
+
+def start_reply_listener(timeout=REPLY_CONNECT_TIMEOUT):
+    """
+    This function will subscribe the publisher client to the {REPLY_CHANNEL} channel, if not already subscribed, and
+    wait up to {timeout} seconds for the subscribe to be connected
+    :param timeout: seconds, maximum wait time for the subscribe
+    :return: True if connected, False if not
+    """
+    with REPLY_LISTENER_LOCK:
+        if not REPLY_LISTENER['started']:
+            pubnub = get_publisher_client()
+            pubnub.add_listener(ReplyCallback())
+            pubnub.subscribe().channels(REPLY_CHANNEL).execute()
+            REPLY_LISTENER['started'] = True
+    return REPLY_LISTENER['connected'].wait(timeout)
+
+
+def send_command(command, timeout=COMMAND_REPLY_TIMEOUT):
+    """
+    This function will publish the command {command}, with a new command id, and wait up to {timeout} seconds for
+    the command result from the device
+    :param command: command to publish, 'NYC-9300#oper#configure replace nvram:startup-config force' for example
+    :param timeout: seconds, maximum wait time for the command result
+    :return: command result - {'id', 'device', 'command', 'status': 'success', 'failed', 'timeout' or 'rejected',
+    'execution_time', 'output_digest', 'round_trip': seconds from publish to result}. If no result is received:
+    {'id', 'command', 'status': 'not_published' if the command was not published or the publish ack not received,
+    'no_reply' if the command result was not received after {timeout} seconds, 'error'}
+    """
+    start_reply_listener()
+    command_id = uuid.uuid4().hex
+    future = Future()
+    with PENDING_REPLIES_LOCK:
+        PENDING_REPLIES[command_id] = future
+    start_time = time.time()
+    try:
+        try:
+            publish_result = publish_message({'id': command_id, 'command': command}).result(PUBLISH_TIMEOUT)
+        except TimeoutError:
+            publish_result = {'ack': False, 'error': 'publish ack not received after ' + str(PUBLISH_TIMEOUT) +
+                                                     ' seconds'}
+        if not publish_result['ack']:
+            print('\nCommand not published: ' + command + ', ' + str(publish_result['error']))
+            return {'id': command_id, 'command': command, 'status': 'not_published',
+                    'error': publish_result['error']}
+        try:
+            reply = future.result(timeout)
+        except TimeoutError:
+            print('\nCommand result not received after ' + str(timeout) + ' seconds: ' + command)
+            return {'id': command_id, 'command': command, 'status': 'no_reply',
+                    'error': 'command result not received after ' + str(timeout) + ' seconds'}
+        reply['round_trip'] = time.time() - start_time
+        print('\nCommand result: ', reply)
+        return reply
+    finally:
+        with PENDING_REPLIES_LOCK:
+            PENDING_REPLIES.pop(command_id, None)
 
 """
 pubnub = pubnub_init()
 print("\nPubNub Channel Info: ", pubnub)
-pubnub.publish().channel(CHANNEL).message('NYC-9300#oper#show ip int bri').async(publish_callback)
+pubnub.publish().channel(CHANNEL).message('NYC-9300#oper#show ip int bri').pn_async(publish_callback)
 pubnub.here_now() \
     .channels(CHANNEL) \
     .include_uuids(True) \
-    .async(here_now_callback)
-"""
\ No newline at end of file
+    .pn_async(here_now_callback)
+"""
@@ -7,6 +7,9 @@
 
 import requests
 import json
+import threading
+import functools
+import collections
 import utils
 
 from config import SNOW_ADMIN, SNOW_DEV, SNOW_PASS, SNOW_URL
@@ -19,6 +22,108 @@ requests.packages.urllib3.disable_warnings(InsecureRequestWarning)  # Disable in
 # SNOW_ADMIN = Application Admin
 # SNOW_DEV = Device REST API Calls
 
+INCIDENT_PAGE_SIZE = 1000  # number of incidents requested with each API call
+
+SYS_ID_CACHE_SIZE = 256  # maximum number of user and incident sys_ids kept in the local caches
+
+INCIDENT_SYS_IDS = collections.OrderedDict()  # incident number to incident sys_id, least recently used first
+INCIDENT_SYS_IDS_LOCK = threading.Lock()
+
+INCIDENT_FLUSH_INTERVAL = 5  # seconds, the queued incident updates are sent at most this long after the first one
+INCIDENT_FLUSH_RETRIES = 3  # number of retries for the pending updates not sent, before they are dropped
+
+INCIDENT_UPDATES = {}  # incident number to pending updates - {'comments', 'close', 'username', 'timer', 'retries'}
+INCIDENT_UPDATES_LOCK = threading.Lock()
+
+COMMENT_CURSORS = {}  # incident number to comments cursor - {'sys_created_on', 'sys_ids': seen at sys_created_on}
+COMMENT_CURSORS_LOCK = threading.Lock()
+
+
+def cache_incident_sys_id(incident, incident_sys_id):
+    """
+    This function will save the incident sys_id {incident_sys_id} for the incident with the number {incident} in the
+    local cache. The least recently used incident is removed when the cache has more than {SYS_ID_CACHE_SIZE} items
+    :param incident: incident number
+    :param incident_sys_id: incident sys_id
+    :return:
+    """
+    with INCIDENT_SYS_IDS_LOCK:
+        INCIDENT_SYS_IDS[incident] = incident_sys_id
+        INCIDENT_SYS_IDS.move_to_end(incident)
+        while len(INCIDENT_SYS_IDS) > SYS_ID_CACHE_SIZE:
+            INCIDENT_SYS_IDS.popitem(last=False)
+
+
+def get_cached_incident_sys_id(incident):
+    """
+    This function will return the incident sys_id for the incident with the number {incident} from the local cache
+    :param incident: incident number
+    :return: incident sys_id, or None if not in the cache
+    """
+    with INCIDENT_SYS_IDS_LOCK:
+        incident_sys_id = INCIDENT_SYS_IDS.get(incident)
+        if incident_sys_id is not None:
+            INCIDENT_SYS_IDS.move_to_end(incident)
+        return incident_sys_id
+
+
+def remove_cached_incident_sys_id(incident):
+    """
+    This function will remove the incident with the number {incident} from the local cache
+    :param incident: incident number
+    :return:
+    """
+    with INCIDENT_SYS_IDS_LOCK:
+        INCIDENT_SYS_IDS.pop(incident, None)
+
+
+def get_incidents_page(offset, limit, query=None, fields=None):
+    """
+    This function will return one page of incidents, starting with the incident number {offset} in the query result
+    :param offset: offset of the first incident, starting with 0
+    :param limit: maximum number of incidents
+    :param query: ServiceNow encoded query, 'active=true^ORDERBYDESCsys_created_on' for example, or None for all
+    :param fields: comma separated list of fields to return, 'number,short_description' for example, or None for all
+    :return: list of incidents info
+    """
+    url = SNOW_URL + '/table/incident'
+    params = {'sysparm_offset': offset, 'sysparm_limit': limit}
+    if query:
+        params['sysparm_query'] = query
+    if fields:
+        params['sysparm_fields'] = fields
+        params['sysparm_exclude_reference_link'] = 'true'
+    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+    response = requests.get(url, params=params, auth=(SNOW_ADMIN, SNOW_PASS), headers=headers)
+    return response.json()['result']
+
+
+def iter_incidents(query=None, fields=None, max_count=None, page_size=INCIDENT_PAGE_SIZE, prefetch=True):
+    """
+    This generator will return the incidents that match the query {query}, one at a time. The incidents are
+    downloaded one page at a time, the next page is downloaded in the background while the caller processes the
+    current page. Use {fields} to download only the fields needed by the caller.
+    The query should include a sort order ('ORDERBY<field>'), for a stable paging
+    :param query: ServiceNow encoded query, or None for all incidents
+    :param fields: comma separated list of fields to return, or None for all
+    :param max_count: maximum number of incidents, or None for all
+    :param page_size: number of incidents requested with each API call
+    :param prefetch: True to download the next page in the background
+    :return: incidents info, one at a time
+    """
+    if max_count is not None:
+        page_size = max(1, min(page_size, max_count))
+
+    def fetch_page(offset, limit):
+        # do not request the incidents after {max_count}, the last page could be shorter
+        if max_count is not None:
+            limit = min(limit, max_count - offset)
+            if limit <= 0:
+                return []
+        return get_incidents_page(offset, limit, query, fields)
+
+    return utils.iter_pages(fetch_page, page_size, prefetch=prefetch)
+
 
 def get_last_incidents_list(incident_count):
     """
@@ -26,13 +131,8 @@ def get_last_incidents_list(incident_count):
     :param incident_count: number of incidents
     :return: incident list - list with all incidents numbers
     """
-    url = SNOW_URL + '/table/incident?sysparm_limit=' + str(incident_count)
-    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-    response = requests.get(url, auth=(SNOW_ADMIN, SNOW_PASS), headers=headers)
-    incident_json = response.json()
-    incident_info = incident_json['result']
     incident_list = []
-    for incident in incident_info:
+    for incident in iter_incidents('ORDERBYDESCsys_created_on', 'number', incident_count):
         incident_list.append(incident['number'])
     return incident_list
 
@@ -43,12 +143,7 @@ def get_last_incidents_info(incident_count):
     :param incident_count: number of incidents
     :return: incident info - info for all incidents
     """
-    url = SNOW_URL + '/table/incident?sysparm_limit=' + str(incident_count)
-    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-    response = requests.get(url, auth=(SNOW_ADMIN, SNOW_PASS), headers=headers)
-    incident_json = response.json()
-    incident_info = incident_json['result']
-    return incident_info
+    return list(iter_incidents('ORDERBYDESCsys_created_on', max_count=incident_count))
 
 
 def get_incident_detail(incident):
@@ -72,7 +167,7 @@ def create_incident(description, comment, username, severity):
     :param comment: comment with incident details
     :param username: caller username
     :param severity: urgency level
-    :return: incident number
+    :return: incident number, the incident sys_id is saved in the local cache
     """
     caller_sys_id = get_user_sys_id(username)
     url = SNOW_URL + '/table/incident'
@@ -85,8 +180,9 @@ def create_incident(description, comment, username, severity):
     headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
     response = requests.post(url, auth=(username, SNOW_PASS), data=json.dumps(payload), headers=headers)
     incident_json = response.json()
-
-    return incident_json['result']['number']
+    incident = incident_json['result']['number']
+    cache_incident_sys_id(incident, incident_json['result']['sys_id'])
+    return incident
 
 
 def update_incident(incident, comment, username):
@@ -96,26 +192,26 @@ def update_incident(incident, comment, username):
     :param username: caller username
     :return:
     """
-    caller_sys_id = get_user_sys_id(username)
-    incident_sys_id = get_incident_sys_id(incident)
-    url = SNOW_URL + '/table/incident/' + incident_sys_id
-    payload = {'comments': (comment + ',\n\nUpdated using APIs by caller: ' + username),
-               'caller_id': caller_sys_id}
-    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-    response = requests.patch(url, auth=(username, SNOW_PASS), data=json.dumps(payload), headers=headers)
+    patch_incident(incident, [comment], False, username)
 
 
 def get_incident_sys_id(incident):
     """
-    This function will find the incident sys_id for the incident with the number {incident}
+    This function will find the incident sys_id for the incident with the number {incident}.
+    The sys_id is retrieved from ServiceNow only if not found in the local cache
     :param incident: incident number
     :return: incident sys_id
     """
-    url = SNOW_URL + '/table/incident?sysparm_limit=1&number=' + incident
+    incident_sys_id = get_cached_incident_sys_id(incident)
+    if incident_sys_id is not None:
+        return incident_sys_id
+    url = SNOW_URL + '/table/incident?sysparm_limit=1&sysparm_fields=sys_id&number=' + incident
     headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
     response = requests.get(url, auth=(SNOW_ADMIN, SNOW_PASS), headers=headers)
     incident_json = response.json()
-    return incident_json['result'][0]['sys_id']
+    incident_sys_id = incident_json['result'][0]['sys_id']
+    cache_incident_sys_id(incident, incident_sys_id)
+    return incident_sys_id
 
 
 def close_incident(incident, username):
@@ -125,20 +221,139 @@ def close_incident(incident, username):
     :param username: user that calls in to close ticket
     :return: status code
     """
-    incident_id = get_incident_sys_id(incident)
-    caller_id = get_user_sys_id(username)
-    url = SNOW_URL + '/table/incident/' + incident_id
-    payload = {'close_code': 'Closed/Resolved by Caller',
-               'state': '7',
-               'caller_id': caller_id,
-               'close_notes': ('Closed using APIs by caller: ' + username)}
+    return patch_incident(incident, [], True, username)
+
+
+def patch_incident(incident, comments, close, username):
+    """
+    This function will update the incident with the number {incident} with one API call: add all the comments from
+    {comments} as one comment, and close the incident if {close} is True
+    :param incident: incident number
+    :param comments: list of comments
+    :param close: True to close the incident
+    :param username: caller username
+    :return: status code
+    """
+    incident_sys_id = get_incident_sys_id(incident)
+    url = SNOW_URL + '/table/incident/' + incident_sys_id
+    payload = {'caller_id': get_user_sys_id(username)}
+    if comments:
+        payload['comments'] = '\n\n'.join(comments) + ',\n\nUpdated using APIs by caller: ' + username
+    if close:
+        payload.update({'close_code': 'Closed/Resolved by Caller',
+                        'state': '7',
+                        'close_notes': ('Closed using APIs by caller: ' + username)})
     headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
-    response = requests.put(url, auth=(username, SNOW_PASS), data=json.dumps(payload), headers=headers)
+    response = requests.patch(url, auth=(username, SNOW_PASS), data=json.dumps(payload), headers=headers)
+    return response.status_code
+
+
+def queue_incident_update(incident, comment, username, close=False):
+    """
+    This function will add the comment {comment} to the pending updates for the incident with the number {incident}.
+    All the pending updates for the same incident are sent with one API call, {INCIDENT_FLUSH_INTERVAL} seconds after
+    the first queued update, or when the function {flush_incident_updates} is called
+    :param incident: incident number
+    :param comment: comment with incident details, or None to queue only the close request
+    :param username: caller username
+    :param close: True to close the incident
+    :return:
+    """
+    with INCIDENT_UPDATES_LOCK:
+        pending = INCIDENT_UPDATES.get(incident)
+        if pending is None:
+            pending = {'comments': [], 'close': False, 'username': username, 'retries': 0}
+            add_pending_updates(incident, pending)
+        if comment:
+            pending['comments'].append(comment)
+        if close:
+            pending['close'] = True
+        pending['username'] = username
+
+
+def add_pending_updates(incident, pending):
+    """
+    This function will add the pending updates {pending} for the incident with the number {incident}, and start the
+    timer that sends them. It must be called with the {INCIDENT_UPDATES_LOCK} acquired
+    :param incident: incident number
+    :param pending: pending updates - {'comments', 'close', 'username', 'retries'}
+    :return:
+    """
+    timer = threading.Timer(INCIDENT_FLUSH_INTERVAL, flush_incident_updates, [incident])
+    timer.daemon = True
+    pending['timer'] = timer
+    INCIDENT_UPDATES[incident] = pending
+    timer.start()
+
+
+def requeue_incident_updates(incident, pending):
+    """
+    This function will add back the pending updates {pending} not sent for the incident with the number {incident},
+    before the updates queued after them. They are sent again with the next flush
+    :param incident: incident number
+    :param pending: pending updates - {'comments', 'close', 'username', 'timer', 'retries'}
+    :return:
+    """
+    with INCIDENT_UPDATES_LOCK:
+        queued = INCIDENT_UPDATES.get(incident)
+        if queued is None:
+            add_pending_updates(incident, pending)
+        else:
+            queued['comments'][:0] = pending['comments']
+            queued['close'] = queued['close'] or pending['close']
+            queued['retries'] = pending['retries']
+
+
+def queue_close_incident(incident, username):
+    """
+    This function will add the close request to the pending updates for the incident with the number {incident}
+    :param incident: incident number
+    :param username: user that calls in to close ticket
+    :return:
+    """
+    queue_incident_update(incident, None, username, close=True)
 
 
+def flush_incident_updates(incident=None):
+    """
+    This function will send the pending updates for the incident with the number {incident}, or for all incidents,
+    one API call for each incident. The updates not sent are queued again, up to {INCIDENT_FLUSH_RETRIES} times.
+    This function is also called by the flush timers, the errors are not raised
+    :param incident: incident number, or None for all incidents
+    :return: {incident number: status code, or None if the API call failed}
+    """
+    with INCIDENT_UPDATES_LOCK:
+        if incident is None:
+            pending_updates = list(INCIDENT_UPDATES.items())
+            INCIDENT_UPDATES.clear()
+        elif incident in INCIDENT_UPDATES:
+            pending_updates = [(incident, INCIDENT_UPDATES.pop(incident))]
+        else:
+            pending_updates = []
+    status_codes = {}
+    for pending_incident, pending in pending_updates:
+        pending['timer'].cancel()
+        try:
+            status_code = patch_incident(pending_incident, pending['comments'], pending['close'], pending['username'])
+        except Exception as e:
+            print('\nIncident ' + pending_incident + ' update failed: ' + str(e))
+            status_code = None
+        if status_code is None or status_code >= 400:
+            if pending['retries'] < INCIDENT_FLUSH_RETRIES:
+                pending['retries'] += 1
+                requeue_incident_updates(pending_incident, pending)
+            else:
+                print('\nIncident ' + pending_incident + ' updates dropped after ' + str(INCIDENT_FLUSH_RETRIES) +
+                      ' retries, status code: ' + str(status_code))
+        status_codes[pending_incident] = status_code
+    return status_codes
+
+
+@functools.lru_cache(maxsize=SYS_ID_CACHE_SIZE)
 def get_user_sys_id(username):
     """
-    This function will retrieve the user sys_id for the user with the name {username}
+    This function will retrieve the user sys_id for the user with the name {username}.
+    The user sys_ids are cached, the sys_id is retrieved from ServiceNow only once for each user
     :param username: the username
     :return: user sys_id
     """
@@ -173,9 +388,76 @@ def delete_incident(incident):
     url = SNOW_URL + '/table/incident/' + incident_id
     headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
     response = requests.delete(url, auth=(SNOW_ADMIN, SNOW_PASS), headers=headers)
+    remove_cached_incident_sys_id(incident)
     return response.status_code
 
 
+def get_new_incident_comments(incident):
+    """
+    This function will return the comments for the incident with the number {incident}, created after the last call
+    for the same incident. Only the journal entries newer than the cursor are downloaded, with the fields used to
+    evaluate the comments. The time stamps have one second resolution, the entries created in the same second as the
+    cursor are downloaded again, and skipped using the sys_id
+    :param incident: incident number
+    :return: list of comments - [{'sys_id', 'value', 'sys_created_on'}], oldest first
+    """
+    with COMMENT_CURSORS_LOCK:
+        cursor = COMMENT_CURSORS.setdefault(incident, {'sys_created_on': None, 'sys_ids': set()})
+        cursor_created_on = cursor['sys_created_on']
+        cursor_sys_ids = set(cursor['sys_ids'])
+
+    incident_sys_id = get_incident_sys_id(incident)
+    query = 'element_id=' + incident_sys_id
+    if cursor_created_on is not None:
+        query += '^sys_created_on>=' + cursor_created_on
+    query += '^ORDERBYsys_created_on'
+    url = SNOW_URL + '/table/sys_journal_field'
+    params = {'sysparm_query': query, 'sysparm_fields': 'sys_id,value,sys_created_on'}
+    headers = {'Content-Type': 'application/json', 'Accept': 'application/json'}
+    response = requests.get(url, params=params, auth=(SNOW_ADMIN, SNOW_PASS), headers=headers)
+    comments_list = response.json()['result']
+
+    new_comments = []
+    for comment_info in comments_list:
+        if comment_info['sys_id'] in cursor_sys_ids:
+            continue
+        new_comments.append(comment_info)
+        if comment_info['sys_created_on'] != cursor_created_on:
+            cursor_created_on = comment_info['sys_created_on']
+            cursor_sys_ids = set()
+        cursor_sys_ids.add(comment_info['sys_id'])
+
+    with COMMENT_CURSORS_LOCK:
+        COMMENT_CURSORS[incident] = {'sys_created_on': cursor_created_on, 'sys_ids': cursor_sys_ids}
+    return new_comments
+
+
+def reset_comment_cursor(incident):
+    """
+    This function will remove the comments cursor for the incident with the number {incident}, the next call to
+    {get_new_incident_comments} will return all the incident comments
+    :param incident: incident number
+    :return:
+    """
+    with COMMENT_CURSORS_LOCK:
+        COMMENT_CURSORS.pop(incident, None)
+
+
+def find_new_comment(incident, comments):
+    """
+    Find if any of the new comments from the {incident}, created after the last call for the same incident, matches
+    exactly one of the {comments}. All the expected comments are evaluated against the same API call
+    :param incident: incident number
+    :param comments: list of comment strings to search for, in priority order
+    :return: the first comment from {comments} that exists, or None
+    """
+    new_values = set(comment_info['value'] for comment_info in get_new_incident_comments(incident))
+    for comment in comments:
+        if comment in new_values:
+            return comment
+    return None
+
+
 def find_comment(incident, comment):
     """
     Find if any of the existing comments from the {incident} matches exactly the {comment}
@@ -5,9 +5,17 @@
 import json
 import requests
 import pubnub
+import threading
+import time
+import hashlib
 
+try:
+    import queue
+except ImportError:
+    import Queue as queue  # Guest Shell Python 2
 
-from config import PUB_KEY, SUB_KEY, CHANNEL
+
+from config import PUB_KEY, SUB_KEY, CHANNEL, REPLY_CHANNEL
 from config import IOS_XE_PASS, IOS_XE_USER, IOS_XE_HOST
 from config import DNAC_URL, DNAC_USER, DNAC_PASS
 
@@ -28,6 +36,16 @@ import dnac_apis
 
 DNAC_AUTH = HTTPBasicAuth(DNAC_USER, DNAC_PASS)
 
+COMMAND_QUEUE_SIZE = 32  # maximum number of commands waiting to be executed
+COMMAND_TIMEOUT = 300  # seconds, maximum execution time for one command, shorter than the controller reply timeout
+
+# the commands are executed by the command worker thread, the PubNub callback thread only queues the commands
+COMMAND_QUEUE = queue.Queue(maxsize=COMMAND_QUEUE_SIZE)
+PENDING_COMMANDS = {}  # the messages waiting in the command queue, and the command ids to reply to
+PENDING_COMMANDS_LOCK = threading.Lock()
+
+PUBNUB = None  # the PubNub client, used to publish the command results
+
 def pubnub_init(device):
 
     # initialize the channel, with the device hostname
@@ -91,30 +109,182 @@ class MySubscribeCallback(SubscribeCallback):
         pass  # handle incoming presence data
 
     def message(self, pubnub, message):
-        new_message = message.message
-        print(str("\nNew message received: " + new_message))
-        new_message_list = new_message.split("#")
-        device = new_message_list[0]
-        if device == DEVICE_HOSTNAME or device == "all":
-            command_type = new_message_list[1]
-            if command_type == 'config':
-                try:
-                    command = new_message_list[2:]
-                    print('\nConfiguration command received: ' + command +'\n\n')
-                    output = configure(command)
-                    output_message = "Configuration command successful"
-                except:
-                    output_message = "Configuration command executed"
-                print(output_message)
+        # the publisher sends the commands queued at the same time as a list, with one message
+        new_messages = message.message
+        if not isinstance(new_messages, list):
+            new_messages = [new_messages]
+        for new_message in new_messages:
+            process_message(new_message)
+
+
+def process_message(new_message):
+    """
+    This function will queue the command from the message {new_message}, if the message is for this device.
+    The message is a string, or a dict with a command id, the command result is published on the {REPLY_CHANNEL}
+    channel for the messages with a command id
+    :param new_message: message, '{device}#{command type}#{command}', the device could be 'all', or
+    {'id': command id, 'command': '{device}#{command type}#{command}'}
+    :return:
+    """
+    command_id = None
+    if isinstance(new_message, dict):
+        command_id = new_message.get('id')
+        new_message = new_message['command']
+    print(str("\nNew message received: " + new_message))
+    new_message_list = new_message.split("#")
+    device = new_message_list[0]
+    if device == DEVICE_HOSTNAME or device == "all":
+        queue_command(new_message, command_id)
+
+
+def queue_command(new_message, command_id=None):
+    """
+    This function will add the message {new_message} to the command queue. The message is not queued if the same
+    message is already waiting in the queue, the command result is published for both command ids. The message is
+    rejected if the queue is full
+    :param new_message: message, '{device}#{command type}#{command}'
+    :param command_id: command id, or None if the command result is not needed
+    :return: True if queued, False if not
+    """
+    with PENDING_COMMANDS_LOCK:
+        if new_message in PENDING_COMMANDS:
+            print('Command already waiting to be executed: ' + new_message)
+            if command_id is not None:
+                PENDING_COMMANDS[new_message].append(command_id)
+            return False
+        try:
+            COMMAND_QUEUE.put_nowait(new_message)
+            PENDING_COMMANDS[new_message] = [command_id] if command_id is not None else []
+            return True
+        except queue.Full:
+            print('Command queue full, command not executed: ' + new_message)
+    if command_id is not None:
+        publish_reply(command_id, new_message, 'rejected', 0, None)
+    return False
+
+
+def execute_command(new_message):
+    """
+    This function will execute the command from the message {new_message}
+    :param new_message: message, '{device}#{command type}#{command}'
+    :return: command status, 'success' or 'failed', command output
+    """
+    new_message_list = new_message.split("#")
+    command_type = new_message_list[1]
+    output = None
+    if command_type == 'config':
+        try:
+            command = new_message_list[2:]
+            print('\nConfiguration command received: ' + str(command) + '\n\n')
+            output = configure(command)
+            status = 'success'
+            output_message = "Configuration command successful"
+        except:
+            status = 'failed'
+            output_message = "Configuration command not successful"
+        print(output_message)
+    else:
+        try:
+            command = new_message_list[2]
+            print('\nOperations command received: ' + command +'\n\n')
+            output = cli(str(command))
+            status = 'success'
+            output_message = 'Successful'
+        except:
+            status = 'failed'
+            output_message = 'Not successful'
+        print('Show Command result: ', output_message)
+    return status, output
+
+
+def publish_reply(command_id, new_message, status, execution_time, output):
+    """
+    This function will publish the command result on the {REPLY_CHANNEL} channel
+    :param command_id: command id, from the controller message
+    :param new_message: message, '{device}#{command type}#{command}'
+    :param status: command status - 'success', 'failed', 'timeout' or 'rejected'
+    :param execution_time: seconds, command execution time
+    :param output: command output, or None
+    :return:
+    """
+    output_digest = None
+    if output is not None:
+        output_digest = hashlib.sha256(str(output).encode('utf-8')).hexdigest()
+    reply = {'id': command_id, 'device': DEVICE_HOSTNAME, 'command': new_message, 'status': status,
+             'execution_time': round(execution_time, 3), 'output_digest': output_digest}
+    try:
+        PUBNUB.publish().channel(REPLY_CHANNEL).message(reply).sync()
+    except Exception as e:
+        print('Command result not published: ' + new_message + ', ' + str(e))
+
+
+def run_with_timeout(function, argument, timeout):
+    """
+    This function will call the function {function} with the argument {argument}, and wait up to {timeout} seconds.
+    The CLI commands can not be interrupted, a command that times out continues to run in the returned thread
+    :param function: function to call
+    :param argument: function argument
+    :param timeout: seconds, maximum wait time
+    :return: (True, function result, thread) if completed, (False, None, thread) if timed out
+    """
+    result = {}
+
+    def target():
+        result['output'] = function(argument)
+
+    thread = threading.Thread(target=target)
+    thread.daemon = True
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive() or 'output' not in result:
+        return False, None, thread
+    return True, result['output'], thread
+
+
+def command_worker(timeout=COMMAND_TIMEOUT):
+    """
+    The command worker thread. It will execute the commands from the command queue, one at a time, each command
+    with a {timeout} seconds timeout. The timeout is reported to the controller, but the next command is executed only
+    after the command that timed out is completed, two commands never run at the same time on the device
+    :param timeout: seconds, maximum execution time for one command
+    :return:
+    """
+    while True:
+        new_message = COMMAND_QUEUE.get()
+        with PENDING_COMMANDS_LOCK:
+            command_ids = PENDING_COMMANDS.pop(new_message, [])
+        try:
+            start_time = time.time()
+            completed, result, thread = run_with_timeout(execute_command, new_message, timeout)
+            if completed:
+                status, output = result
             else:
-                try:
-                    command = new_message_list[2]
-                    print('\nOperations command received: ' + command +'\n\n')
-                    output_message = cli(str(command))
-                    output_message = 'Successful'
-                except:
-                    output_message = 'Not successful'
-                print('Show Command result: ', output_message)
+                status, output = 'timeout', None
+                print('Command timeout, after ' + str(timeout) + ' seconds: ' + new_message)
+            execution_time = time.time() - start_time
+            for command_id in command_ids:
+                publish_reply(command_id, new_message, status, execution_time, output)
+
+            # wait for the command that timed out, before the next command
+            thread.join()
+            if not completed:
+                print('Command completed, after ' + str(round(time.time() - start_time, 3)) + ' seconds: ' +
+                      new_message)
+        except Exception as e:
+            print('Command failed: ' + new_message + ', ' + str(e))
+        finally:
+            COMMAND_QUEUE.task_done()
+
+
+def start_command_worker():
+    """
+    This function will start the command worker thread
+    :return: command worker thread
+    """
+    thread = threading.Thread(target=command_worker)
+    thread.daemon = True
+    thread.start()
+    return thread
 
 
 def main():
@@ -124,7 +294,7 @@ def main():
     The application will listen to a PubNub channel and execute commands, configuration or operational.
     :return:
     """
-    global DEVICE_HOSTNAME, DEVICE_LOCATION
+    global DEVICE_HOSTNAME, DEVICE_LOCATION, PUBNUB
 
     # retrieve the device hostname using NETCONF
     DEVICE_HOSTNAME = netconf_restconf.get_restconf_hostname(IOS_XE_HOST, IOS_XE_USER, IOS_XE_PASS)
@@ -135,8 +305,12 @@ def main():
     DEVICE_LOCATION = dnac_apis.get_device_location(DEVICE_HOSTNAME, dnac_token)
     print(str("\nDevice Location: " + DEVICE_LOCATION))
 
+    # start the command worker, the commands are executed without blocking the PubNub messages
+    start_command_worker()
+
     # init the PubNub channel
     pubnub = pubnub_init(DEVICE_HOSTNAME)
+    PUBNUB = pubnub
 
     pubnub.add_listener(MySubscribeCallback())
     pubnub.subscribe().channels(CHANNEL).execute()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+
+# This file contains the tests for the compliance rules functions
+
+import pytest
+
+import compliance_rules
+import config_parser
+
+
+OVERLAPPING_RULES = [
+    {'name': 'ACL Policy', 'pattern': r'access-list', 'fail_comment': 'ACL'},
+    {'name': 'Named ACL Policy', 'pattern': r'ip access-list', 'fail_comment': 'Named ACL'},
+    {'name': 'Logging Policy', 'pattern': r'logging', 'fail_comment': 'Logging'},
+    {'name': 'Logging Host Policy', 'pattern': r'logging host', 'fail_comment': 'Logging host'}
+]
+
+
+def get_rule_names(rules):
+    return [rule['name'] for rule in rules]
+
+
+def test_evaluate_rules_overlapping_patterns():
+    compiled_rules = compliance_rules.compile_rules(OVERLAPPING_RULES)
+    violations, passed = compliance_rules.evaluate_rules('\n+ip access-list extended X\n',
+                                                         compiled_rules=compiled_rules)
+    assert get_rule_names(violations) == ['ACL Policy', 'Named ACL Policy']
+    violations, passed = compliance_rules.evaluate_rules('\n+logging host 1.1.1.1\n', compiled_rules=compiled_rules)
+    assert get_rule_names(violations) == ['Logging Policy', 'Logging Host Policy']
+    assert get_rule_names(passed) == ['ACL Policy', 'Named ACL Policy']
+
+
+def test_evaluate_rules_checks():
+    tree = config_parser.parse_config('hostname SW1\n')
+    violations, passed = compliance_rules.evaluate_rules('\n+hostname SW1\n', {'duplicate_ipv4': lambda changes: True,
+                                                                               'subnet_overlap': lambda changes: False},
+                                                         trees=(tree, tree))
+    assert get_rule_names(violations) == ['Duplicate IPv4 Prevention']
+    assert get_rule_names(passed) == ['ACL Policy', 'Logging Policy', 'Subnet Overlap Prevention']
+
+
+def test_evaluate_rules_sections():
+    old_tree = config_parser.parse_config('hostname SW1\n!\nip access-list extended ACL_IN\n permit ip any any\n!\n'
+                                          'logging host 10.9.9.9\n!\ninterface Vlan10\n description users\n')
+    acl_tree = config_parser.parse_config('hostname SW1\n!\nip access-list extended ACL_IN\n deny ip any any\n!\n'
+                                          'logging host 10.9.9.9\n!\ninterface Vlan10\n description users\n')
+    logging_tree = config_parser.parse_config('hostname SW1\n!\nip access-list extended ACL_IN\n permit ip any any\n'
+                                              '!\nno logging console\nlogging host 10.9.9.9\n!\ninterface Vlan10\n'
+                                              ' description users\n')
+    interface_tree = config_parser.parse_config('hostname SW1\n!\nip access-list extended ACL_IN\n'
+                                                ' permit ip any any\n!\nlogging host 10.9.9.9\n!\n'
+                                                'interface Vlan10\n description access-list users logging\n')
+    violations, passed = compliance_rules.evaluate_rules('', trees=(old_tree, acl_tree))
+    assert get_rule_names(violations) == ['ACL Policy']
+    violations, passed = compliance_rules.evaluate_rules('', trees=(old_tree, logging_tree))
+    assert get_rule_names(violations) == ['Logging Policy']
+    violations, passed = compliance_rules.evaluate_rules('', trees=(old_tree, interface_tree))
+    assert violations == []
+
+
+def test_evaluate_rules_sections_without_trees():
+    with pytest.raises(ValueError):
+        compliance_rules.evaluate_rules('\n+hostname SW1\n')
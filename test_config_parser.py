@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+
+# This file contains the tests for the IOS configuration parser functions
+
+import config_parser
+
+
+CONFIG = '''Building configuration...
+
+Current configuration : 1024 bytes
+!
+hostname SW1
+!
+interface Vlan10
+ description users
+ ip address 10.1.1.1 255.255.255.0
+!
+router bgp 65000
+ address-family ipv4
+  neighbor 10.2.2.2 activate
+ exit-address-family
+!
+ip access-list extended ACL_IN
+ permit ip any any
+access-list 10 permit 10.1.1.0 0.0.0.255
+access-list 10 deny any
+!
+banner motd ^C
+ Authorized access only
+interface Vlan99
+^C
+!
+line vty 0 4
+ transport input ssh
+!
+end
+'''
+
+
+def test_parse_config_nesting():
+    tree = config_parser.parse_config(CONFIG)
+    router = config_parser.get_section(tree, 'router', 'bgp 65000')
+    address_family = router['children'][0]
+    assert address_family['text'] == 'address-family ipv4'
+    assert config_parser.get_children_commands(address_family) == ['neighbor 10.2.2.2 activate']
+    assert config_parser.get_children_commands(router) == ['address-family ipv4', 'exit-address-family']
+    assert address_family['children'][0]['parent'] is address_family
+    assert config_parser.get_section_text(router) == (
+        'router bgp 65000\n address-family ipv4\n  neighbor 10.2.2.2 activate\n exit-address-family')
+
+
+def test_parse_config_banner():
+    tree = config_parser.parse_config(CONFIG)
+    banner = config_parser.get_section(tree, 'banner', 'motd ^C')
+    assert [child['text'] for child in banner['children']] == [' Authorized access only', 'interface Vlan99', '^C']
+
+    # the banner lines are not commands
+    assert list(config_parser.get_sections(tree, 'interface')) == ['Vlan10']
+    assert config_parser.get_section(tree, 'line', 'vty 0 4')['children'][0]['text'] == 'transport input ssh'
+
+
+def test_parse_config_index():
+    tree = config_parser.parse_config(CONFIG)
+    assert [node['text'] for node in tree['children']][:2] == ['hostname SW1', 'interface Vlan10']
+    assert config_parser.get_children_commands(config_parser.get_section(tree, 'interface', 'Vlan10'),
+                                               'ip address') == ['ip address 10.1.1.1 255.255.255.0']
+    assert list(config_parser.get_sections(tree, 'ip access-list')) == ['ACL_IN']
+    assert len(config_parser.get_sections(tree, 'access-list')['10']) == 2
+    assert config_parser.get_section(tree, 'interface', 'Vlan20') is None
+    assert config_parser.get_section_type('no logging console') == ('logging', 'console')
+
+
+def test_get_changed_sections():
+    old_tree = config_parser.parse_config(CONFIG)
+    new_tree = config_parser.parse_config(CONFIG.replace('access-list 10 deny any\n', '').replace(
+        ' description users\n', ' description servers\n'))
+    assert config_parser.get_changed_sections(old_tree, new_tree, 'access-list') == ['10']
+    assert config_parser.get_changed_sections(old_tree, new_tree, 'interface') == ['Vlan10']
+    assert config_parser.get_changed_sections(old_tree, new_tree, 'ip access-list') == []
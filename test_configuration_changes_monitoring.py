@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+
+# This file contains the tests for the configuration changes monitoring functions
+
+from concurrent.futures import Future
+
+import configuration_changes_monitoring
+
+
+def test_compare_config_sections_without_trailing_new_line():
+    old_cfg = 'a\n!\nb\nc'.splitlines(True)
+    new_cfg = 'a\n!\nb\nd'.splitlines(True)
+    config_text, sections_info = configuration_changes_monitoring.compare_config_sections(old_cfg, new_cfg)
+    assert config_text == '\n b\n-c\n+d\n'
+    assert sections_info == [{'section': 'b', 'added': ['d'], 'removed': ['c']}]
+
+
+def test_compare_config_sections_interface_change():
+    old_cfg = 'hostname SW1\n!\ninterface Vlan10\n ip address 10.1.1.1 255.255.255.0\n!\nend\n'.splitlines(True)
+    new_cfg = 'hostname SW1\n!\ninterface Vlan10\n ip address 10.1.2.1 255.255.255.0\n!\nend\n'.splitlines(True)
+    config_text, sections_info = configuration_changes_monitoring.compare_config_sections(old_cfg, new_cfg)
+    assert '+ ip address 10.1.2.1 255.255.255.0' in config_text
+    assert sections_info == [{'section': 'interface Vlan10',
+                              'added': [' ip address 10.1.2.1 255.255.255.0'],
+                              'removed': [' ip address 10.1.1.1 255.255.255.0']}]
+
+
+def test_compare_config_sections_no_changes():
+    cfg = 'hostname SW1\n!\nend\n'.splitlines(True)
+    assert configuration_changes_monitoring.compare_config_sections(cfg, cfg) == ('', [])
+
+
+def test_get_sections_summary():
+    sections_info = [{'section': 'interface Vlan10', 'added': [' shutdown'], 'removed': []}]
+    summary = configuration_changes_monitoring.get_sections_summary(sections_info)
+    assert summary == '\ninterface Vlan10: 1 lines added, 0 lines removed'
+
+
+def test_get_changed_ipv4_config(tmp_path, monkeypatch):
+    monkeypatch.setattr(configuration_changes_monitoring.config_store, 'SNAPSHOT_DIR', str(tmp_path))
+    old_config = ('hostname SW1\n!\ninterface Vlan10\n description users\n ip address 10.1.1.1 255.255.255.0\n!\n'
+                  'interface Vlan20\n ip address 10.2.1.1 255.255.255.0\n!\nend\n')
+    new_config = ('hostname SW1\n!\ninterface Vlan10\n description users\n ip address 10.1.1.1 255.255.255.0\n'
+                  ' ip address 10.1.2.1 255.255.255.0 secondary\n!\ninterface Vlan20\n ip address 10.2.1.1 255.255.255.0\n'
+                  '!\nlogging host 10.9.9.9\n!\nend\n')
+    old_hash = configuration_changes_monitoring.config_store.save_snapshot(old_config)
+    new_hash = configuration_changes_monitoring.config_store.save_snapshot(new_config)
+    config_text, sections_info = configuration_changes_monitoring.compare_config_sections(
+        configuration_changes_monitoring.config_store.get_snapshot(old_hash).splitlines(True),
+        configuration_changes_monitoring.config_store.get_snapshot(new_hash).splitlines(True))
+    ipv4_config = configuration_changes_monitoring.get_changed_ipv4_config(new_hash, sections_info)
+    assert ipv4_config == '!\ninterface Vlan10\n ip address 10.1.2.1 255.255.255.0 secondary\n!\n'
+
+
+def test_get_changed_ipv4_config_no_addresses(tmp_path, monkeypatch):
+    monkeypatch.setattr(configuration_changes_monitoring.config_store, 'SNAPSHOT_DIR', str(tmp_path))
+    new_hash = configuration_changes_monitoring.config_store.save_snapshot('hostname SW1\n!\nlogging host 10.9.9.9\n')
+    sections_info = [{'section': 'logging host 10.9.9.9', 'added': ['logging host 10.9.9.9'], 'removed': []}]
+    assert configuration_changes_monitoring.get_changed_ipv4_config(new_hash, sections_info) == ''
+
+
+def test_get_change_marker_command_output():
+    marker_output = ('show running-config | include Last configuration change\n'
+                     '! Last configuration change at 10:15:01 UTC Mon Oct 12 2026 by admin\nNYC-9300#')
+    marker = '! Last configuration change at 10:15:01 UTC Mon Oct 12 2026 by admin'
+    assert configuration_changes_monitoring.get_change_marker(marker_output) == marker
+    assert configuration_changes_monitoring.get_change_marker('Building configuration...\n' + marker + '\n!\n') == marker
+    assert configuration_changes_monitoring.get_change_marker('show running-config | include Last configuration '
+                                                              'change\nNYC-9300#') is None
+
+
+def test_get_changed_devices(tmp_path, monkeypatch):
+    monkeypatch.setattr(configuration_changes_monitoring.config_store, 'SNAPSHOT_DIR', str(tmp_path))
+    marker = '! Last configuration change at 10:15:01 UTC Mon Oct 12 2026 by admin'
+    for device in ['SW1', 'SW2']:
+        configuration_changes_monitoring.config_store.set_baseline(device, 'hostname ' + device + '\n')
+        configuration_changes_monitoring.config_store.set_device_marker(device, marker)
+    outputs = {'SW1': configuration_changes_monitoring.CHANGE_MARKER_COMMAND + '\n' + marker + '\nSW1#',
+               'SW2': configuration_changes_monitoring.CHANGE_MARKER_COMMAND + '\n' + marker + ' by other\nSW2#'}
+    monkeypatch.setattr(configuration_changes_monitoring.dnac_apis, 'get_output_command_runner_batch',
+                        lambda commands, device_names, token: dict(
+                            (device, {commands[0]: outputs[device]}) for device in device_names))
+    assert configuration_changes_monitoring.get_changed_devices(['SW1', 'SW2'], 'token') == ['SW2']
+
+
+def run_refresh_device_ipv4_index(monkeypatch, task_info):
+    calls = []
+    monkeypatch.setattr(configuration_changes_monitoring.dnac_apis, 'get_device_id_name', lambda device, token: 'id1')
+    monkeypatch.setattr(configuration_changes_monitoring.dnac_apis, 'sync_device',
+                        lambda device, token: calls.append('sync') or (202, 'task1'))
+    monkeypatch.setattr(configuration_changes_monitoring.dnac_apis, 'check_task_id_output',
+                        lambda task_id, token: calls.append('wait') or task_info)
+    monkeypatch.setattr(configuration_changes_monitoring.dnac_apis, 'refresh_ipv4_index_devices',
+                        lambda device_ids, token: calls.append('refresh'))
+    monkeypatch.setattr(configuration_changes_monitoring.dnac_apis, 'invalidate_ipv4_index',
+                        lambda: calls.append('invalidate'))
+    configuration_changes_monitoring.refresh_device_ipv4_index('SW1', 'token')
+    return calls
+
+
+def test_refresh_device_ipv4_index_after_sync(monkeypatch):
+    assert run_refresh_device_ipv4_index(monkeypatch, {'endTime': 1}) == ['sync', 'wait', 'refresh']
+
+
+def test_refresh_device_ipv4_index_sync_failed(monkeypatch):
+    calls = run_refresh_device_ipv4_index(monkeypatch, {'endTime': 1, 'isError': True, 'failureReason': 'timeout'})
+    assert calls == ['sync', 'wait', 'invalidate']
+
+
+def run_monitor_device_changes(monkeypatch, tmp_path, rollback_status):
+    monkeypatch.setattr(configuration_changes_monitoring.config_store, 'SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(configuration_changes_monitoring.dnac_apis, 'get_device_location', lambda device, token: 'NYC')
+    monkeypatch.setattr(configuration_changes_monitoring.dnac_apis, 'get_device_management_ip',
+                        lambda device, token: '10.93.141.1')
+    monkeypatch.setattr(configuration_changes_monitoring, 'refresh_device_ipv4_index', lambda device, token: None)
+    monkeypatch.setattr(configuration_changes_monitoring.service_now_apis, 'create_incident',
+                        lambda description, comment, username, severity: 'INC0010001')
+    monkeypatch.setattr(configuration_changes_monitoring.service_now_apis, 'queue_incident_update',
+                        lambda incident, comment, username, close=False: None)
+    monkeypatch.setattr(configuration_changes_monitoring.service_now_apis, 'flush_incident_updates',
+                        lambda incident=None: {})
+    monkeypatch.setattr(configuration_changes_monitoring.pubnub_apis, 'send_command',
+                        lambda command: {'command': command, 'status': rollback_status})
+    configuration_changes_monitoring.config_store.set_baseline('SW1', 'hostname SW1\n!\nend\n')
+    new_config = '! Last configuration change by admin\nhostname SW1\n!\nlogging host 10.9.9.9\n!\nend\n'
+    baseline_match = configuration_changes_monitoring.monitor_device_changes('SW1', new_config, 'token')
+    return baseline_match, configuration_changes_monitoring.config_store.get_device_marker('SW1')
+
+
+def test_monitor_device_changes_rolled_back(tmp_path, monkeypatch):
+    baseline_match, marker = run_monitor_device_changes(monkeypatch, tmp_path, 'success')
+    assert baseline_match
+    assert marker == '! Last configuration change by admin'
+
+
+def test_monitor_device_changes_roll_back_not_confirmed(tmp_path, monkeypatch):
+    baseline_match, marker = run_monitor_device_changes(monkeypatch, tmp_path, 'no_reply')
+    assert not baseline_match
+    assert marker is None
+
+
+class StopDaemon(BaseException):
+    pass
+
+
+class InlineExecutor(object):
+    # runs each task when submitted, the daemon sees the same results at each run
+    def __init__(self, max_workers):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def submit(self, function, *args):
+        future = Future()
+        try:
+            future.set_result(function(*args))
+        except Exception as error:
+            future.set_exception(error)
+        return future
+
+
+def test_run_daemon_failures(monkeypatch):
+    clock = {'now': 1000.0, 'ticks': 0}
+    tokens = []
+    polls = []
+
+    def sleep(seconds):
+        clock['ticks'] += 1
+        if clock['ticks'] == 4:
+            raise StopDaemon()
+        clock['now'] += 1000
+
+    def get_monitored_devices(token):
+        if clock['ticks'] == 1:
+            raise ValueError('inventory not available')
+        return {'SW1': {'hostname': 'SW1', 'role': 'ACCESS'}}
+
+    def submit_monitor_devices(executor, device_names, token):
+        polls.append(list(device_names))
+        raise KeyError('response')
+
+    monkeypatch.setattr(configuration_changes_monitoring, 'ThreadPoolExecutor', InlineExecutor)
+    monkeypatch.setattr(configuration_changes_monitoring.time, 'time', lambda: clock['now'])
+    monkeypatch.setattr(configuration_changes_monitoring.time, 'sleep', sleep)
+    monkeypatch.setattr(configuration_changes_monitoring.dnac_apis, 'get_dnac_jwt_token',
+                        lambda auth: tokens.append(clock['ticks']) or 'token')
+    monkeypatch.setattr(configuration_changes_monitoring, 'get_monitored_devices', get_monitored_devices)
+    monkeypatch.setattr(configuration_changes_monitoring, 'get_poll_interval', lambda device_info: 500)
+    monkeypatch.setattr(configuration_changes_monitoring.random, 'uniform', lambda low, high: 0)
+    monkeypatch.setattr(configuration_changes_monitoring, 'submit_monitor_devices', submit_monitor_devices)
+    try:
+        configuration_changes_monitoring.run_daemon(2)
+    except StopDaemon:
+        pass
+
+    # the daemon continues after the failures, and a new token is requested after each failure
+    assert polls == [['SW1'], ['SW1'], ['SW1']]
+    assert tokens == [0, 1, 2, 3]
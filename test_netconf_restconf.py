@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+
+# This file contains the tests for the RESTCONF functions
+
+import pytest
+import requests
+
+import netconf_restconf
+
+
+class FakeSession(object):
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.content = content
+
+    def get(self, url):
+        response = requests.Response()
+        response.status_code = self.status_code
+        response._content = self.content
+        response.url = url
+        return response
+
+
+class FakeManager(object):
+    def __init__(self, password):
+        self.password = password
+        self.connected = True
+
+    def close_session(self):
+        self.connected = False
+
+
+def test_netconf_session_password_change(monkeypatch):
+    monkeypatch.setattr(netconf_restconf, 'NETCONF_SESSIONS', {})
+    monkeypatch.setattr(netconf_restconf, 'netconf_connect',
+                        lambda host, port, user, password: FakeManager(password))
+    with netconf_restconf.netconf_session('10.1.1.1', 830, 'admin', 'old') as m:
+        session = m
+    with netconf_restconf.netconf_session('10.1.1.1', 830, 'admin', 'old') as m:
+        assert m is session
+    with netconf_restconf.netconf_session('10.1.1.1', 830, 'admin', 'new') as m:
+        assert m is not session
+        assert m.password == 'new'
+
+
+def test_get_restconf_session_password_change(monkeypatch):
+    monkeypatch.setattr(netconf_restconf, 'RESTCONF_SESSIONS', {})
+    session = netconf_restconf.get_restconf_session('10.1.1.1', 'admin', 'old')
+    assert netconf_restconf.get_restconf_session('10.1.1.1', 'admin', 'old') is session
+    new_session = netconf_restconf.get_restconf_session('10.1.1.1', 'admin', 'new')
+    assert new_session is not session
+    assert new_session.auth.password == 'new'
+
+
+def test_get_restconf_hostname_error(monkeypatch):
+    monkeypatch.setattr(netconf_restconf, 'get_restconf_session', lambda host, user, password: FakeSession(401, b''))
+    with pytest.raises(requests.HTTPError):
+        netconf_restconf.get_restconf_hostname('10.1.1.1', 'admin', 'password')
+
+
+def test_get_restconf_data_batch_error(monkeypatch):
+    monkeypatch.setattr(netconf_restconf, 'get_restconf_session', lambda host, user, password: FakeSession(404, b''))
+    assert netconf_restconf.get_restconf_data_batch(['a', 'b'], '10.1.1.1', 'admin', 'password') == {'a': None,
+                                                                                                      'b': None}
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+
+
+# This file contains the tests for the PubNub APIs functions
+
+from concurrent.futures import Future
+
+import pubnub_apis
+
+
+def test_send_command_publish_ack_timeout(monkeypatch):
+    monkeypatch.setattr(pubnub_apis, 'start_reply_listener', lambda: True)
+    monkeypatch.setattr(pubnub_apis, 'publish_message', lambda message: Future())
+    monkeypatch.setattr(pubnub_apis, 'PUBLISH_TIMEOUT', 0.01)
+    reply = pubnub_apis.send_command('NYC-9300#oper#save running-config startup-config')
+    assert reply['status'] == 'not_published'
+    assert not pubnub_apis.PENDING_REPLIES
+
+
+def test_send_command_reply_timeout(monkeypatch):
+    def publish_message(message):
+        future = Future()
+        future.set_result({'ack': True, 'timetoken': 1, 'error': None})
+        return future
+
+    monkeypatch.setattr(pubnub_apis, 'start_reply_listener', lambda: True)
+    monkeypatch.setattr(pubnub_apis, 'publish_message', publish_message)
+    reply = pubnub_apis.send_command('NYC-9300#oper#save running-config startup-config', timeout=0.01)
+    assert reply['status'] == 'no_reply'
+    assert not pubnub_apis.PENDING_REPLIES
+
+
+def test_pub_message_publish_ack_timeout(monkeypatch):
+    monkeypatch.setattr(pubnub_apis, 'publish_message', lambda message: Future())
+    result = pubnub_apis.pub_message('NYC-9300#oper#show ip int bri', timeout=0.01)
+    assert result['ack'] is False
+    assert result['error']
+
+
+def test_pub_message_presence(monkeypatch, capsys):
+    def publish_message(message):
+        future = Future()
+        future.set_result({'ack': True, 'timetoken': 1, 'error': None})
+        return future
+
+    monkeypatch.setattr(pubnub_apis, 'publish_message', publish_message)
+    monkeypatch.setattr(pubnub_apis, 'get_presence_info', lambda: {'occupancy': 1, 'uuids': ['NYC-9300']})
+    assert pubnub_apis.pub_message('NYC-9300#oper#show ip int bri', check_presence=True)['ack']
+    assert 'uuid: NYC-9300' in capsys.readouterr().out
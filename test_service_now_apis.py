@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+
+
+# This file contains the tests for the ServiceNow APIs functions
+
+import service_now_apis
+
+
+def test_flush_incident_updates_requeue_failed(monkeypatch):
+    patches = []
+
+    def patch_incident(incident, comments, close, username):
+        patches.append((incident, list(comments), close))
+        if len(patches) == 1:
+            raise ConnectionError('connection refused')
+        return 200
+
+    monkeypatch.setattr(service_now_apis, 'patch_incident', patch_incident)
+    monkeypatch.setattr(service_now_apis, 'INCIDENT_FLUSH_INTERVAL', 60)
+    service_now_apis.queue_incident_update('INC0010001', 'first', 'user')
+    assert service_now_apis.flush_incident_updates('INC0010001') == {'INC0010001': None}
+
+    # the failed updates are sent again before the updates queued after them
+    service_now_apis.queue_close_incident('INC0010001', 'user')
+    assert service_now_apis.flush_incident_updates('INC0010001') == {'INC0010001': 200}
+    assert patches == [('INC0010001', ['first'], False), ('INC0010001', ['first'], True)]
+    assert 'INC0010001' not in service_now_apis.INCIDENT_UPDATES
+
+
+def test_flush_incident_updates_drop_after_retries(monkeypatch):
+    monkeypatch.setattr(service_now_apis, 'patch_incident', lambda incident, comments, close, username: 500)
+    monkeypatch.setattr(service_now_apis, 'INCIDENT_FLUSH_INTERVAL', 60)
+    service_now_apis.queue_incident_update('INC0010002', 'comment', 'user')
+    for retry in range(service_now_apis.INCIDENT_FLUSH_RETRIES + 1):
+        assert service_now_apis.flush_incident_updates('INC0010002') == {'INC0010002': 500}
+    assert 'INC0010002' not in service_now_apis.INCIDENT_UPDATES
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+
+
+# This file contains the tests for the device command functions, the IOS XE cli module is replaced with a fake module
+
+import sys
+import threading
+import time
+import types
+
+import pytest
+
+
+@pytest.fixture
+def sub_message(monkeypatch):
+    cli_module = types.ModuleType('cli')
+    cli_module.commands = []
+    cli_module.cli = lambda command: cli_module.commands.append(('cli', command)) or 'output'
+    cli_module.configure = lambda configuration: cli_module.commands.append(('configure', configuration)) or []
+    monkeypatch.setitem(sys.modules, 'cli', cli_module)
+    monkeypatch.delitem(sys.modules, 'sub_message', raising=False)
+    import sub_message
+    sub_message.cli_module = cli_module
+    return sub_message
+
+
+def test_execute_command_config(sub_message):
+    status, output = sub_message.execute_command('NYC-9300#config#interface Vlan10#description users')
+    assert status == 'success'
+    assert sub_message.cli_module.commands == [('configure', ['interface Vlan10', 'description users'])]
+
+
+def test_execute_command_config_failed(sub_message, monkeypatch):
+    def configure(configuration):
+        raise Exception('invalid input')
+
+    monkeypatch.setattr(sub_message, 'configure', configure)
+    status, output = sub_message.execute_command('NYC-9300#config#interface Vlan10#shutdown')
+    assert status == 'failed'
+    assert output is None
+
+
+def test_execute_command_oper(sub_message):
+    status, output = sub_message.execute_command('NYC-9300#oper#show ip int bri')
+    assert (status, output) == ('success', 'output')
+    assert sub_message.cli_module.commands == [('cli', 'show ip int bri')]
+
+
+def test_command_worker_one_command_at_a_time(sub_message, monkeypatch):
+    running = []
+    replies = []
+    first_done = threading.Event()
+
+    def execute_command(new_message):
+        running.append(new_message)
+        assert len(running) == 1
+        if new_message.endswith('first'):
+            time.sleep(0.2)
+            first_done.set()
+        else:
+            assert first_done.is_set()
+        running.remove(new_message)
+        return 'success', None
+
+    monkeypatch.setattr(sub_message, 'execute_command', execute_command)
+    monkeypatch.setattr(sub_message, 'publish_reply',
+                        lambda command_id, new_message, status, execution_time, output: replies.append(
+                            (command_id, status)))
+    monkeypatch.setattr(sub_message, 'COMMAND_QUEUE', sub_message.queue.Queue())
+    monkeypatch.setattr(sub_message, 'PENDING_COMMANDS', {})
+    sub_message.queue_command('NYC-9300#oper#first', 'id1')
+    sub_message.queue_command('NYC-9300#oper#second', 'id2')
+    worker = threading.Thread(target=sub_message.command_worker, args=(0.05,))
+    worker.daemon = True
+    worker.start()
+    sub_message.COMMAND_QUEUE.join()
+    assert replies == [('id1', 'timeout'), ('id2', 'success')]
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+
+# This file contains the tests for the utils functions
+
+import importlib
+import ipaddress
+import sys
+
+import utils
+
+
+CONFIG = ('hostname SW1\n!\ninterface Vlan10\n ip address 10.1.1.1 255.255.255.0\n ipv6 address 2001:DB8::1/64\n!\n'
+          'router ospf 1\n ip address 10.2.2.2 255.255.255.0\n!\n'
+          'interface Vlan20\n description users\n ip address 10.3.3.1 255.255.255.0 secondary\n!\nend\n')
+
+
+def test_iter_ip_addresses_interface():
+    addresses = [(address['address'], address['interface']) for address in utils.iter_ip_addresses(CONFIG)]
+    assert addresses == [('10.1.1.1', 'Vlan10'), ('2001:DB8::1', 'Vlan10'), ('10.2.2.2', ''),
+                         ('10.3.3.1', 'Vlan20')]
+
+
+def test_iter_ip_addresses_interface_across_chunks(monkeypatch):
+    # one line for each chunk, the interface commands and the addresses are not in the same chunk
+    iter_config_chunks = utils.iter_config_chunks
+    monkeypatch.setattr(utils, 'iter_config_chunks', lambda configuration: iter_config_chunks(configuration, 1))
+    addresses = [(address['address'], address['interface'])
+                 for address in utils.iter_ip_addresses(CONFIG.splitlines(True))]
+    assert addresses == [('10.1.1.1', 'Vlan10'), ('2001:DB8::1', 'Vlan10'), ('10.2.2.2', ''),
+                         ('10.3.3.1', 'Vlan20')]
+
+
+def test_import_without_python3_modules(monkeypatch):
+    # the IOS XE Guest Shell could run Python 2, without the ipaddress and concurrent.futures modules
+    monkeypatch.setitem(sys.modules, 'ipaddress', None)
+    monkeypatch.setitem(sys.modules, 'concurrent.futures', None)
+    monkeypatch.delitem(sys.modules, 'utils')
+    guest_shell_utils = importlib.import_module('utils')
+    pages = {0: [1, 2], 2: [3]}
+    assert list(guest_shell_utils.iter_pages(lambda offset, limit: pages[offset], 2)) == [1, 2, 3]
+
+
+def test_find_prefix_overlaps():
+    prefixes = [(ipaddress.IPv4Network('10.0.0.0/8'), 'wide'), (ipaddress.IPv4Network('10.1.1.0/24'), 'lan'),
+                (ipaddress.IPv4Network('10.1.1.0/30'), 'p2p'), (ipaddress.IPv4Network('10.1.1.0/30'), 'p2p peer'),
+                (ipaddress.IPv4Network('10.1.2.0/30'), 'other'), (ipaddress.IPv4Network('192.168.1.0/24'), 'lab')]
+    prefix_index = utils.build_prefix_index(prefixes)
+    overlaps = utils.find_prefix_overlaps(prefix_index, ipaddress.IPv4Network('10.1.1.0/30'))
+    assert sorted(info for network, info in overlaps) == ['lan', 'p2p', 'p2p peer', 'wide']
+    overlaps = utils.find_prefix_overlaps(prefix_index, ipaddress.IPv4Network('10.1.1.0/30'), include_identical=False)
+    assert sorted(info for network, info in overlaps) == ['lan', 'wide']
+    overlaps = utils.find_prefix_overlaps(prefix_index, ipaddress.IPv4Network('10.1.0.0/16'))
+    assert sorted(info for network, info in overlaps) == ['lan', 'other', 'p2p', 'p2p peer', 'wide']
+    assert not utils.has_prefix_overlap(prefix_index, ipaddress.IPv4Network('172.16.0.0/12'))
+    assert not utils.has_prefix_overlap(prefix_index, ipaddress.IPv4Network('192.168.1.0/24'), include_identical=False)
+
+
+class ReadCounter(list):
+    reads = 0
+
+    def __getitem__(self, position):
+        self.reads += 1
+        return list.__getitem__(self, position)
+
+
+def test_find_prefix_overlaps_wide_prefix():
+    # the lookup does not read all the prefixes after a wide prefix
+    prefixes = [(ipaddress.IPv4Network('10.0.0.0/8'), 'wide')]
+    prefixes += [(ipaddress.IPv4Network(((10 << 24) + 4 * number, 30)), number) for number in range(1000)]
+    prefix_index = utils.build_prefix_index(prefixes)
+    prefix_index['items'] = ReadCounter(prefix_index['items'])
+    overlaps = utils.find_prefix_overlaps(prefix_index, ipaddress.IPv4Network(((10 << 24) + 4 * 500, 30)))
+    assert [info for network, info in overlaps] == ['wide', 500]
+    assert prefix_index['items'].reads <= 1
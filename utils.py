@@ -6,9 +6,11 @@
 
 # the utils module includes common utilized utility functions
 
+import bisect  # needed for the prefix index search
 import json
 import os
 import os.path
+import random  # needed for the backoff jitter
 import re  # needed for regular expressions matching
 import select
 import socket  # needed for IPv4 validation
@@ -18,8 +20,32 @@ import subprocess  # needed for the ping function
 
 from urllib3.exceptions import InsecureRequestWarning
 
+# the module is also imported on the IOS XE Guest Shell, that could run Python 2
+try:
+    import ipaddress  # needed for the prefix index
+except ImportError:
+    ipaddress = None  # Guest Shell Python 2, the IPv4 prefix functions are not available
+
+try:
+    from concurrent.futures import ThreadPoolExecutor  # needed for the page prefetch
+except ImportError:
+    ThreadPoolExecutor = None  # Guest Shell Python 2, the pages are downloaded without prefetch
+
 urllib3.disable_warnings(InsecureRequestWarning)  # Disable insecure https warnings
 
+CONFIG_CHUNK_SIZE = 1048576  # configuration chunk size, in characters, for the address extraction
+
+# IPv4 address, each octet 0-255
+IPV4_PATTERN = r'(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)(?:\.(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)){3}'
+
+# {ip address a.b.c.d [m.m.m.m] [secondary]} and {ipv6 address x:x::x[/len]} commands, compiled once
+IP_ADDRESS_PATTERN = re.compile(r'[ \t]*(?:ip address (?P<ipv4>' + IPV4_PATTERN + r')(?: (?P<mask>' + IPV4_PATTERN +
+                                r'))?(?P<secondary> secondary)?(?=\s)|ipv6 address (?P<ipv6>[0-9A-Fa-f]*:[0-9A-Fa-f:.]*)'
+                                r'(?:/(?P<prefix>\d{1,3}))?(?=[\s/]))')
+
+# the last top level (not indented) configuration line, the greedy '.*' will find the last one with one match
+TOP_LEVEL_LINE_PATTERN = re.compile(r'.*^([^ \t\n][^\n]*)', re.MULTILINE | re.DOTALL)
+
 
 def pprint(json_data):
     """
@@ -85,32 +111,226 @@ def validate_ipv4_address(ip_address):
         return False
 
 
+def iter_config_chunks(configuration, chunk_size=CONFIG_CHUNK_SIZE):
+    """
+    This generator will return the configuration {configuration} in chunks of complete lines, of about {chunk_size}
+    characters, each chunk ends with a new line
+    :param configuration: string with the configuration, a file, or an iterable of configuration lines
+    :param chunk_size: chunk size, in characters
+    :return: configuration chunks
+    """
+    if isinstance(configuration, str):
+        yield configuration if configuration.endswith('\n') else configuration + '\n'
+    elif hasattr(configuration, 'read'):
+        remainder = ''
+        while True:
+            data = configuration.read(chunk_size)
+            if not data:
+                break
+            data = remainder + data
+            last_line_end = data.rfind('\n') + 1
+            remainder = data[last_line_end:]
+            if last_line_end:
+                yield data[:last_line_end]
+        if remainder:
+            yield remainder + '\n'
+    else:
+        lines = []
+        lines_size = 0
+        for line in configuration:
+            line = line.rstrip('\r\n')
+            lines.append(line)
+            lines_size += len(line) + 1
+            if lines_size >= chunk_size:
+                yield '\n'.join(lines) + '\n'
+                lines = []
+                lines_size = 0
+        if lines:
+            yield '\n'.join(lines) + '\n'
+
+
+def get_block_interface(top_level_line_match, interface):
+    """
+    This function will return the interface name for the configuration lines after the top level command matched by
+    {top_level_line_match}: the interface name for an interface command, '' for any other command
+    :param top_level_line_match: match for the {TOP_LEVEL_LINE_PATTERN}, or None if no top level command
+    :param interface: current interface name, returned if no top level command
+    :return: interface name, or ''
+    """
+    if top_level_line_match is None:
+        return interface
+    command = top_level_line_match.group(1)
+    if command.startswith('interface '):
+        return command[10:].strip()
+    return ''
+
+
+def iter_ip_addresses(configuration):
+    """
+    This generator will return all the IPv4 and IPv6 addresses configured with the {ip address} and {ipv6 address}
+    commands, found in the configuration {configuration}.
+    The configuration is processed in one pass, in chunks: the chunks are searched for the ' address ' string, and
+    only the lines that include it are matched with the compiled regular expression {IP_ADDRESS_PATTERN}
+    :param configuration: string with the configuration, a file, or an iterable of configuration lines
+    :return: address info - {'address', 'mask', 'interface', 'secondary', 'version'}, the mask is the IPv4 mask,
+    the IPv6 prefix length, or None if not configured
+    """
+    interface = ''
+    match = IP_ADDRESS_PATTERN.match
+    top_level_match = TOP_LEVEL_LINE_PATTERN.match
+    for chunk in iter_config_chunks(configuration):
+        find = chunk.find
+        rfind = chunk.rfind
+        searched = 0
+        position = find(' address ')
+        while position != -1:
+            line_start = rfind('\n', 0, position) + 1
+
+            # find the last top level command before this line, the addresses are on an interface only if it is an
+            # interface command
+            interface = get_block_interface(top_level_match(chunk, searched, line_start), interface)
+            if chunk[line_start] not in ' \t':
+                interface = ''
+            searched = line_start
+
+            address_match = match(chunk, line_start)
+            if address_match:
+                ipv4_address = address_match.group('ipv4')
+                if ipv4_address:
+                    yield {'address': ipv4_address, 'mask': address_match.group('mask'), 'interface': interface,
+                           'secondary': address_match.group('secondary') is not None, 'version': 4}
+                else:
+                    yield {'address': address_match.group('ipv6'), 'mask': address_match.group('prefix'),
+                           'interface': interface, 'secondary': False, 'version': 6}
+
+            # continue with the next line
+            position = find(' address ', find('\n', position))
+
+        # the top level commands after the last address, the interface is used for the next chunk
+        interface = get_block_interface(top_level_match(chunk, searched), interface)
+
+
+def identify_ip_addresses(configuration):
+    """
+    This function will return a list of all IPv4 and IPv6 addresses found in the configuration {configuration}
+    :param configuration: string with the configuration, a file, or an iterable of configuration lines
+    :return: list of address info - {'address', 'mask', 'interface', 'secondary', 'version'}
+    """
+    return list(iter_ip_addresses(configuration))
+
+
 def identify_ipv4_address(configuration):
     """
     This function will return a list of all IPv4 addresses found in the string {configuration}.
     It will return only the IPv4 addresses found in the {ip address a.b.c.d command}
-    :param configuration: string with the configuration
+    :param configuration: string with the configuration, a file, or an iterable of configuration lines
     :return: list of IPv4 addresses
     """
     ipv4_list = []
-    pattern = re.compile('^\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}$')
-    split_lines = configuration.split('\n')  # split configuration file in individual commands'
-    for line in split_lines:
-        if 'ip address' in line:  # check if command includes the string 'ip address'
-            split_config = line.split(' ')  # split the command in words
+    for address_info in iter_ip_addresses(configuration):
+        if address_info['version'] == 4:
+            ipv4_list.append(address_info['address'])
+    return ipv4_list
+
+
+def identify_ipv4_prefixes(configuration):
+    """
+    This function will return a list of all IPv4 addresses and masks found in the string {configuration}.
+    It will return only the IPv4 addresses found in the {ip address a.b.c.d m.m.m.m} command
+    :param configuration: string with the configuration, a file, or an iterable of configuration lines
+    :return: list of IPv4 interfaces, address and mask - ipaddress.IPv4Interface
+    """
+    ipv4_list = []
+    for address_info in iter_ip_addresses(configuration):
+        if address_info['version'] == 4 and address_info['mask']:
             try:
-                split_config.remove('')  # remove the first ' ' if existing in the command
-            except:
+                ipv4_list.append(ipaddress.IPv4Interface(address_info['address'] + '/' + address_info['mask']))
+            except ValueError:
                 pass
-            line_begins = split_config[0:3]  # select the three items in the list
-            for word in line_begins:
-                check_ip = pattern.match(word)  # match each word with the pattern from regex
-                if check_ip:
-                    if validate_ipv4_address(word):  # validate if the octets are valid IP addresses
-                        ipv4_list.append(word)
     return ipv4_list
 
 
+def build_prefix_index(prefixes):
+    """
+    This function will build an index for the IPv4 prefixes in the list {prefixes}. Two IPv4 prefixes are either
+    disjoint or one contains the other, the overlapping prefixes are:
+    - the prefixes that contain the prefix, or are identical: one lookup for each prefix length in the index, by the
+      network address and the prefix length
+    - the prefixes contained in the prefix: the prefixes with the network address in the prefix range, sorted by the
+      network address and found with a binary search
+    The overlaps for one prefix are found in O(log n + number of overlaps)
+    :param prefixes: list of (IPv4 network, info) - (ipaddress.IPv4Network, any data to return for overlaps)
+    :return: prefix index
+    """
+    intervals = []
+    for network, info in prefixes:
+        intervals.append((int(network.network_address), network.prefixlen, network, info))
+    intervals.sort(key=lambda interval: (interval[0], interval[1]))
+    prefix_index = {'starts': [], 'prefix_lengths': [], 'items': [], 'networks': {}}
+    for start, prefix_length, network, info in intervals:
+        prefix_index['starts'].append(start)
+        prefix_index['prefix_lengths'].append(prefix_length)
+        prefix_index['items'].append((network, info))
+        prefix_index['networks'].setdefault((start, prefix_length), []).append((network, info))
+    prefix_index['network_prefix_lengths'] = sorted(set(prefix_index['prefix_lengths']))
+    return prefix_index
+
+
+def iter_prefix_overlaps(prefix_index, network, include_identical=True):
+    """
+    This generator will return the prefixes from the index {prefix_index} that overlap the IPv4 prefix {network}: the
+    prefixes that contain {network}, and then the prefixes contained in {network}
+    :param prefix_index: prefix index, from the function {build_prefix_index}
+    :param network: IPv4 prefix - ipaddress.IPv4Network
+    :param include_identical: False to skip the prefixes identical to {network}
+    :return: (IPv4 network, info) for each overlapping prefix
+    """
+    start = int(network.network_address)
+    prefix_length = network.prefixlen
+
+    # the prefixes that contain the prefix, or are identical
+    networks = prefix_index['networks']
+    for network_prefix_length in prefix_index['network_prefix_lengths']:
+        if network_prefix_length > prefix_length or (network_prefix_length == prefix_length and not include_identical):
+            break
+        mask = (0xFFFFFFFF << (32 - network_prefix_length)) & 0xFFFFFFFF
+        for item in networks.get((start & mask, network_prefix_length), ()):
+            yield item
+
+    # the prefixes contained in the prefix, with the network address in the prefix range
+    position = bisect.bisect_left(prefix_index['starts'], start)
+    last_position = bisect.bisect_right(prefix_index['starts'], int(network.broadcast_address))
+    prefix_lengths = prefix_index['prefix_lengths']
+    items = prefix_index['items']
+    for position in range(position, last_position):
+        if prefix_lengths[position] > prefix_length:
+            yield items[position]
+
+
+def has_prefix_overlap(prefix_index, network, include_identical=True):
+    """
+    This function will check if the IPv4 prefix {network} overlaps any prefix in the index {prefix_index}, in O(log n)
+    :param prefix_index: prefix index, from the function {build_prefix_index}
+    :param network: IPv4 prefix - ipaddress.IPv4Network
+    :param include_identical: False to ignore the prefixes identical to {network}
+    :return: True/False
+    """
+    for item in iter_prefix_overlaps(prefix_index, network, include_identical):
+        return True
+    return False
+
+
+def find_prefix_overlaps(prefix_index, network, include_identical=True):
+    """
+    This function will return all the prefixes from the index {prefix_index} that overlap the IPv4 prefix {network}
+    :param prefix_index: prefix index, from the function {build_prefix_index}
+    :param network: IPv4 prefix - ipaddress.IPv4Network
+    :param include_identical: False to skip the prefixes identical to {network}
+    :return: list of (IPv4 network, info) for the overlapping prefixes
+    """
+    return list(iter_prefix_overlaps(prefix_index, network, include_identical))
+
+
 def ping_return(hostname):
     """
     Use the ping utility to attempt to reach the host. We send 5 packets
@@ -128,3 +348,56 @@ def ping_return(hostname):
         return_code = 'Unknown'
     return return_code
 
+
+def iter_pages(fetch_page, page_size, first_offset=0, prefetch=True):
+    """
+    This generator will walk a paginated API, calling {fetch_page} for each page, and it will yield the records one
+    at a time. Only the current page, and the next one if {prefetch}, are kept in memory.
+    If {prefetch} is True, the next page is downloaded in the background while the caller processes the current page,
+    if the concurrent.futures module is available
+    :param fetch_page: function called with the offset and the limit, returns the list of records for one page
+    :param page_size: number of records requested for each page
+    :param first_offset: offset of the first record, 0 or 1, depending on the API
+    :param prefetch: True to download the next page in the background
+    :return: records, one at a time
+    """
+    offset = first_offset
+    executor = None
+    prefetch = prefetch and ThreadPoolExecutor is not None
+    if prefetch:
+        executor = ThreadPoolExecutor(max_workers=1)
+        next_page = executor.submit(fetch_page, offset, page_size)
+    try:
+        while True:
+            if prefetch:
+                page = next_page.result()
+            else:
+                page = fetch_page(offset, page_size)
+            offset += page_size
+
+            # start downloading the next page, only if the current page is full
+            if prefetch and len(page) == page_size:
+                next_page = executor.submit(fetch_page, offset, page_size)
+            for record in page:
+                yield record
+            if len(page) < page_size:
+                break
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+
+def backoff_delays(initial_delay, max_delay, factor=2):
+    """
+    This generator will return the wait times for a polling loop: exponential backoff, starting with {initial_delay},
+    multiplied by {factor} each time, up to {max_delay}. Each wait time includes a random jitter, up to 50%, to avoid
+    many pollers sending requests at the same time
+    :param initial_delay: first wait time, in seconds
+    :param max_delay: maximum wait time, in seconds
+    :param factor: backoff multiplier
+    :return: wait times, in seconds
+    """
+    delay = initial_delay
+    while True:
+        yield delay * random.uniform(0.5, 1)
+        delay = min(delay * factor, max_delay)
@@ -47,33 +47,21 @@ def main():
     dnac_token = dnac_apis.get_dnac_jwt_token(DNAC_AUTH)
     print('\nThe DNA Center token is: ', dnac_token, '\n')
 
-    # check each address against network devices and clients database
+    # check each address against network devices and clients, using the local IPv4 address index
     # initialize duplicate_ip
 
     duplicate_ip = False
     for ipv4_address in ipv4_address_list:
-
-        # check against network devices interfaces
-
-        try:
-            device_info = dnac_apis.check_ipv4_network_interface(ipv4_address, dnac_token)
-            duplicate_ip = True
-            if len(device_info) == 2:
-                print('The IPv4 address ', ipv4_address, ' is used on this device ', device_info[0], ' interface ', device_info[1])
-            else:
-                print('The IPv4 address ', ipv4_address, ' is used on this device ', device_info[0])
-        except:
-            pass
-
-        # check against any hosts
-
-        try:
-            client_info = dnac_apis.get_client_info(ipv4_address, dnac_token)
-            if client_info is not None:
-                duplicate_ip = True
-                print('The IPv4 address ', ipv4_address, ' is used by a client')
-        except:
-            pass
+        address_info = dnac_apis.lookup_ipv4_address(ipv4_address, dnac_token)
+        if address_info is None:
+            continue
+        duplicate_ip = True
+        if address_info[0] == 'client':
+            print('The IPv4 address ', ipv4_address, ' is used by a client')
+        elif address_info[2]:
+            print('The IPv4 address ', ipv4_address, ' is used on this device ', address_info[1], ' interface ', address_info[2])
+        else:
+            print('The IPv4 address ', ipv4_address, ' is used on this device ', address_info[1])
 
     if duplicate_ip:
         print('\nDeploying the template ', config_file, ' will create duplicated IPv4 addresses')